@@ -1,9 +1,10 @@
-from flask import Flask, request, abort
+from flask import Flask, request, abort, jsonify
 import json
 from functools import wraps
 from jose import jwt
 from urllib.request import urlopen
 
+from token_cache import VerifiedTokenCache
 
 app = Flask(__name__)
 
@@ -11,6 +12,9 @@ AUTH0_DOMAIN = @TODO_REPLACE_WITH_YOUR_DOMAIN
 ALGORITHMS = ['RS256']
 API_AUDIENCE = @TODO_REPLACE_WITH_YOUR_API_AUDIENCE
 
+# Payloads of verified tokens are reused until they expire
+token_cache = VerifiedTokenCache()
+
 
 class AuthError(Exception):
     def __init__(self, error, status_code):
@@ -105,20 +109,30 @@ def verify_decode_jwt(token):
             }, 400)
 
 
-def requires_auth(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        token = get_token_auth_header()
-        try:
-            payload = verify_decode_jwt(token)
-        except:
-            abort(401)
-        return f(payload, *args, **kwargs)
+def requires_auth(bypass_cache=False):
+    # bypass_cache verifies the token on every request, for endpoints that
+    # should not be reached on the strength of an earlier check
+    def requires_auth_decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            token = get_token_auth_header()
+            try:
+                payload = token_cache.verify(token, verify_decode_jwt, bypass_cache)
+            except:
+                abort(401)
+            return f(payload, *args, **kwargs)
 
-    return wrapper
+        return wrapper
+    return requires_auth_decorator
 
 @app.route('/headers')
-@requires_auth
+@requires_auth()
 def headers(payload):
     print(payload)
-    return 'Access Granted'
\ No newline at end of file
+    return 'Access Granted'
+
+@app.route('/token-cache')
+@requires_auth(bypass_cache=True)
+def token_cache_stats(payload):
+    # Hit rate and verification time saved by the token cache
+    return jsonify(token_cache.stats())
\ No newline at end of file
@@ -2,13 +2,16 @@
 # Imports
 #----------------------------------------------------------------------------#
 
+import click
+import hmac
 import json
-import dateutil.parser
-import babel
+from collections import Counter
+from itertools import groupby
 from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, inspect
+from sqlalchemy import case, func, inspect
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.sql import text
 import logging
 from logging import Formatter, FileHandler
@@ -16,6 +19,14 @@ from flask_wtf import Form
 from forms import *
 from sqlalchemy.dialects import postgresql
 from flask_migrate import Migrate
+from search import install_search_ddl, search_backend_for
+from pagination import InvalidCursor, keyset_page, page_size_from
+from db_engine import pool_stats
+from date_format import format_datetime
+from fragment_cache import init_fragment_cache
+from query_profiler import QueryProfiler
+from show_import import READERS, IdSet, ShowImporter, decode_lines, feed_format
+from catalogue_import import CatalogueUpserter
 
 
 #----------------------------------------------------------------------------#
@@ -27,6 +38,10 @@ moment = Moment(app)
 app.config.from_object('config')
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
+# Query count and database time per request, see query_profiler.py
+profiler = QueryProfiler(app)
+# {% cache %} blocks in the templates, see fragment_cache.py
+init_fragment_cache(app)
 
 # TODO: connect to a local postgresql database
 
@@ -37,6 +52,10 @@ migrate = Migrate(app, db)
 
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    # Natural key of the bulk upserts, see catalogue_import.py
+    __table_args__ = (
+        db.UniqueConstraint('name', 'city', 'state', name='uq_Venue_name_city_state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -50,6 +69,15 @@ class Venue(db.Model):
     genres = db.Column(db.ARRAY(db.String(120)))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(500))
+    # Maintained by record_new_show() and roll_show_counters()
+    upcoming_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    # Incremented by SQLAlchemy on every ORM update, keys the cached
+    # fragments of the venue page
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version_id}
     venues = db.relationship('Artist', secondary='Show',
                              backref=db.backref('shows', lazy='joined'))
 
@@ -61,9 +89,16 @@ class Venue(db.Model):
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    # Serves the keyset pagination of /artists
+    __table_args__ = (
+        db.Index('ix_Artist_name_id', 'name', 'id'),
+        # Natural key of the bulk upserts, see catalogue_import.py
+        db.UniqueConstraint('name', 'city', 'state', name='uq_Artist_name_city_state'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String)
+    # Keyset pagination sort key, can't be NULL (see pagination.py)
+    name = db.Column(db.String, nullable=False)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
@@ -74,17 +109,67 @@ class Artist(db.Model):
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     genres = db.Column(db.ARRAY(db.String(120)))
     seeking_description = db.Column(db.String(500))
+    # Maintained by record_new_show() and roll_show_counters()
+    upcoming_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    # Incremented by SQLAlchemy on every ORM update, keys the cached
+    # fragments of the artist page
+    version_id = db.Column(db.Integer, nullable=False, server_default='1')
+    __mapper_args__ = {'version_id_col': version_id}
 
     def __repr__(self):
         return 'Artist Id:{} | Name: {}'.format(self.id, self.name)
 
 
-# Created an Association Table
-Show = db.Table('Show', db.Model.metadata,
-                db.Column('Venue_id', db.Integer, db.ForeignKey('Venue.id')),
-                db.Column('Artist_id', db.Integer, db.ForeignKey('Artist.id')),
-                db.Column('start_time', db.DateTime)
-                )
+class Show(db.Model):
+    __tablename__ = 'Show'
+    # Every past/upcoming lookup filters on a venue or an artist and a
+    # start_time range
+    __table_args__ = (
+        db.Index('ix_Show_Venue_id_start_time', 'Venue_id', 'start_time'),
+        db.Index('ix_Show_Artist_id_start_time', 'Artist_id', 'start_time'),
+        # Serves the keyset pagination of /shows and the counter rolls
+        db.Index('ix_Show_start_time_id', 'start_time', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    Venue_id = db.Column(db.Integer, db.ForeignKey('Venue.id'))
+    Artist_id = db.Column(db.Integer, db.ForeignKey('Artist.id'))
+    # Keyset pagination sort key, can't be NULL (see pagination.py)
+    start_time = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return 'Show Id:{} | Venue Id: {} | Artist Id: {}'.format(
+            self.id, self.Venue_id, self.Artist_id)
+
+
+# Single row holding the point in time up to which shows have been rolled
+# from the upcoming to the past counters. Shows starting after rolled_until
+# are counted as upcoming, everything else as past.
+#
+# The venue and artist pages list their shows split at the current time, so
+# between two runs of roll-show-counters a show that has just started is
+# listed as past while it is still counted as upcoming. The gap is at most
+# the interval of the cron job.
+class ShowCounterState(db.Model):
+    __tablename__ = 'ShowCounterState'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_until = db.Column(db.DateTime, nullable=False)
+
+    def __repr__(self):
+        return 'Show counters rolled until {}'.format(self.rolled_until)
+
+install_search_ddl(db.Model.metadata, [Venue.__table__, Artist.__table__])
+
+# Models and forms of the bulk upserts
+CATALOGUES = {
+    'venues': (Venue, VenueForm),
+    'artists': (Artist, ArtistForm),
+}
+
 # TODO: implement any missing fields, as a database migration using Flask-Migrate
 
 # TODO Implement Show and Artist models, and complete all model relationships and properties, as a database migration.
@@ -110,19 +195,246 @@ def get_dict_list_from_result(result):
     return list_dict
 
 
+# Queries shared by the controllers and the EXPLAIN checks in test_app.py
+
+
+def upcoming_show_counts_query(now):
+    return (db.session.query(
+        Show.Venue_id.label('venue_id'),
+        func.count(Show.id).label('num_shows'))
+        .filter(Show.start_time > now)
+        .group_by(Show.Venue_id))
+
+
+def venue_shows_query(venue_id):
+    return (db.session.query(
+        Artist.id.label('artist_id'),
+        Artist.name.label('artist_name'),
+        Artist.image_link.label('artist_image_link'),
+        Show.start_time)
+        .join(Artist, Artist.id == Show.Artist_id)
+        .filter(Show.Venue_id == venue_id)
+        .order_by(Show.start_time))
+
+
+def artist_shows_query(artist_id):
+    return (db.session.query(
+        Venue.id.label("venue_id"),
+        Venue.name.label("venue_name"),
+        Venue.image_link.label("venue_image_link"),
+        Show.start_time)
+        .join(Venue, Venue.id == Show.Venue_id)
+        .filter(Show.Artist_id == artist_id)
+        .order_by(Show.start_time))
+
+
+def artists_query():
+    return db.session.query(Artist.id, Artist.name, Artist.image_link)
+
+
+def shows_query():
+    return (db.session.query(
+        Show.id,
+        Show.start_time,
+        Venue.id.label("venue_id"),
+        Venue.name.label("venue_name"),
+        Artist.id.label("artist_id"),
+        Artist.name.label("artist_name"),
+        Artist.image_link.label("artist_image_link"))
+        .join(Venue, Venue.id == Show.Venue_id)
+        .join(Artist, Artist.id == Show.Artist_id))
+
+
+# Builds the area -> venues -> upcoming show count tree from a single query,
+# joining every venue with a pre-aggregated count of its upcoming shows
+
+
+def venue_directory():
+    upcoming_shows = upcoming_show_counts_query(datetime.now()).subquery()
+
+    venue_rows = (db.session.query(
+        Venue.id,
+        Venue.name,
+        Venue.city,
+        Venue.state,
+        func.coalesce(upcoming_shows.c.num_shows, 0).label('num_shows'))
+        .outerjoin(upcoming_shows, upcoming_shows.c.venue_id == Venue.id)
+        .order_by(Venue.state, Venue.city, Venue.name, Venue.id)
+        .all())
+
+    # Areas are keyed on both city and state, so that e.g. Portland, OR and
+    # Portland, ME are listed separately
+    areas = []
+    for (city, state), area_venues in groupby(venue_rows, key=lambda row: (row.city, row.state)):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [{
+                'id': ven.id,
+                'name': ven.name,
+                'num_shows': ven.num_shows
+            } for ven in area_venues]
+        })
+    return areas
+
+
+# Show counters: upcoming/past show counts are stored on the Venue and Artist
+# rows so the detail pages can read them without counting the Show table
+
+
+def show_counter_state():
+    state = ShowCounterState.query.with_for_update().get(1)
+    if state is None:
+        state = rebuild_show_counters()
+    return state
+
+
+def seed_show_counter_state(now):
+    # Inserts the state row unless it exists. The migration seeds it, this
+    # covers databases made with db.create_all(). Concurrent first runs can't
+    # both insert it: the others' inserts do nothing and they wait on the
+    # row lock taken after
+    table = ShowCounterState.__table__
+    if db.session.get_bind().dialect.name == 'postgresql':
+        insert = postgresql.insert(table).on_conflict_do_nothing(index_elements=['id'])
+    else:
+        insert = table.insert().prefix_with('OR IGNORE', dialect='sqlite')
+    db.session.execute(insert.values(id=1, rolled_until=now))
+
+
+def rebuild_show_counters(now=None):
+    # Recomputes every counter from the Show table, as of now
+    now = now or datetime.now()
+    state = ShowCounterState.query.with_for_update().get(1)
+    if state is None:
+        seed_show_counter_state(now)
+        state = ShowCounterState.query.with_for_update().get(1)
+    state.rolled_until = now
+
+    for model, show_column in ((Venue, Show.Venue_id), (Artist, Show.Artist_id)):
+        counted_shows = (db.session.query(func.count(show_column))
+                         .filter(show_column == model.id))
+        model.query.update({
+            'upcoming_shows_count': counted_shows.filter(Show.start_time > now).as_scalar(),
+            'past_shows_count': counted_shows.filter(Show.start_time <= now).as_scalar()
+        }, synchronize_session=False)
+    db.session.flush()
+    return state
+
+
+def record_new_show(venue_id, artist_id, start_time):
+    # Counts a newly inserted show, in the caller's transaction
+    state = show_counter_state()
+    if start_time > state.rolled_until:
+        counter = 'upcoming_shows_count'
+    else:
+        counter = 'past_shows_count'
+
+    for model, model_id in ((Venue, venue_id), (Artist, artist_id)):
+        model.query.filter(model.id == model_id).update(
+            {counter: getattr(model, counter) + 1}, synchronize_session=False)
+
+
+def record_new_shows(shows):
+    # Counts a batch of show dicts about to be inserted, in the caller's
+    # transaction, with one UPDATE per table and counter
+    state = show_counter_state()
+    counts = Counter()
+    for show in shows:
+        if show['start_time'] > state.rolled_until:
+            counter = 'upcoming_shows_count'
+        else:
+            counter = 'past_shows_count'
+        counts[Venue, counter, show['Venue_id']] += 1
+        counts[Artist, counter, show['Artist_id']] += 1
+
+    for model, counter in sorted({key[:2] for key in counts}, key=str):
+        added = {model_id: count for (key_model, key_counter, model_id), count
+                 in counts.items() if (key_model, key_counter) == (model, counter)}
+        model.query.filter(model.id.in_(added)).update({
+            counter: getattr(model, counter) + case(added, value=model.id, else_=0)
+        }, synchronize_session=False)
+
+
+def import_shows(lines, format='csv', batch_size=None):
+    # Streams a CSV or NDJSON feed of shows into the Show table, see
+    # show_import.py. Returns the ImportReport.
+    importer = ShowImporter(db.session, Show.__table__,
+                            IdSet(db.session, Venue.id),
+                            IdSet(db.session, Artist.id),
+                            before_insert=record_new_shows,
+                            batch_size=batch_size or app.config.get('IMPORT_BATCH_SIZE', 1000))
+    return importer.run(READERS[format](lines))
+
+
+def upsert_catalogue(kind, lines, format='csv', batch_size=None):
+    # Validates venue or artist records with the rules of their form and
+    # upserts them on (name, city, state), see catalogue_import.py.
+    # Returns the UpsertReport.
+    model, form_class = CATALOGUES[kind]
+    upserter = CatalogueUpserter(db.session, model, form_class,
+                                 batch_size=batch_size or app.config.get('UPSERT_BATCH_SIZE', 500))
+    return upserter.run(READERS[format](lines))
+
+
+def roll_show_counters(now=None):
+    # Moves the shows that started since the last roll from the upcoming to
+    # the past counters. Only the venues and artists with such shows are
+    # touched. Returns the number of shows moved.
+    now = now or datetime.now()
+    state = show_counter_state()
+    if now <= state.rolled_until:
+        return 0
+    moved = (Show.query.filter(Show.start_time > state.rolled_until)
+             .filter(Show.start_time <= now).count())
+
+    for model, show_column in ((Venue, Show.Venue_id), (Artist, Show.Artist_id)):
+        rolled_shows = (db.session.query(show_column)
+                        .filter(Show.start_time > state.rolled_until)
+                        .filter(Show.start_time <= now))
+        rolled = (db.session.query(func.count(show_column))
+                  .filter(show_column == model.id)
+                  .filter(Show.start_time > state.rolled_until)
+                  .filter(Show.start_time <= now)
+                  .as_scalar())
+        model.query.filter(model.id.in_(rolled_shows)).update({
+            'upcoming_shows_count': model.upcoming_shows_count - rolled,
+            'past_shows_count': model.past_shows_count + rolled
+        }, synchronize_session=False)
+
+    state.rolled_until = now
+    db.session.commit()
+    return moved
+
+
+# Splits a venue's or an artist's shows, fetched in a single query ordered by
+# start time, into past and upcoming shows
+
+
+def partition_shows(shows, now):
+    past_shows = []
+    upcoming_shows = []
+    for show in shows:
+        if show.start_time > now:
+            upcoming_shows.append(show)
+        else:
+            past_shows.append(show)
+    return past_shows, upcoming_shows
+
+
+# Search runs on the trigram indexes on Postgres, config SEARCH_BACKEND can
+# swap in another backend from search.py
+
+
+def search_backend():
+    return app.config.get('SEARCH_BACKEND') or search_backend_for(db.session)
+
+
 #----------------------------------------------------------------------------#
 # Filters.
 #----------------------------------------------------------------------------#
 
-def format_datetime(value, format='medium'):
-    date = dateutil.parser.parse(value)
-    if format == 'full':
-        format = "EEEE MMMM, d, y 'at' h:mma"
-    elif format == 'medium':
-        format = "EE MM, dd, y h:mma"
-    return babel.dates.format_datetime(date, format, locale='en')
-
-
+# Patterns are compiled once and results memoized, see date_format.py
 app.jinja_env.filters['datetime'] = format_datetime
 
 #----------------------------------------------------------------------------#
@@ -144,51 +456,22 @@ def venues():
     # TODO DONE: replace with real venues data.
     #       num_shows should be aggregated based on number of upcoming shows per venue.
 
-    groupby_venues_result = (db.session.query(
-        Venue.city,
-        Venue.state
-    )
-        .group_by(
-        Venue.city,
-        Venue.state
-    )
-    )
-    data = get_dict_list_from_result(groupby_venues_result)
-    print(str(data))
-
-    for area in data:
-
-        area['venues'] = [object_as_dict(
-            ven) for ven in Venue.query.filter_by(city=area['city']).all()]
+    return render_template('pages/venues.html', areas=venue_directory())
 
-        for ven in area['venues']:
 
-            ven['num_shows'] = db.session.query(func.count(Show.c.Venue_id)).filter(
-                Show.c.Venue_id == ven['id']).filter(Show.c.start_time > datetime.now()).all()[0][0]
-
-    return render_template('pages/venues.html', areas=data)
-
-
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for Hop should return "The Musical Hop".
     # search for "Music" should return "The Musical Hop" and "Park Square Live Music & Coffee"
-    search_term = request.form.get('search_term', '')
-    search_venues_count = (db.session.query(
-        func.count(Venue.id))
-        .filter(Venue.name.contains(search_term))
-        .all())
-
-    search_venues_result = Venue.query.filter(
-        Venue.name.contains(search_term)).all()
-
-    response = {
-        "count": search_venues_count[0][0],
-        "data": search_venues_result
-    }
+    # Later pages are fetched with GET, carrying the term and a cursor
+    search_term = request.values.get('search_term', '')
+    response = search_backend().search(Venue, search_term,
+                                       after=request.values.get('after'),
+                                       before=request.values.get('before'),
+                                       page_size=page_size_from(request.values))
 
-    return render_template('pages/search_venues.html', results=response, search_term=search_term)
+    return render_template('pages/search_venues.html', results=response, page=response, search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
@@ -200,37 +483,10 @@ def show_venue(venue_id):
     if single_venue is None:
         return not_found_error(404)
     else:
-        single_venue.past_shows = (db.session.query(
-            Artist.id.label('artist_id'),
-            Artist.name.label('artist_name'),
-            Artist.image_link.label('artist_image_link'),
-            Show)
-            .filter(Show.c.Venue_id == venue_id)
-            .filter(Show.c.Artist_id == Artist.id)
-            .filter(Show.c.start_time <= datetime.now())
-            .all())
-
-        single_venue.upcoming_shows = (db.session.query(
-            Artist.id.label("artist_id"),
-            Artist.name.label("artist_name"),
-            Artist.image_link.label("artist_image_link"),
-            Show)
-            .filter(Show.c.Venue_id == venue_id)
-            .filter(Show.c.Artist_id == Artist.id)
-            .filter(Show.c.start_time > datetime.now())
-            .all())
-
-        single_venue.past_shows_count = (db.session.query(
-            func.count(Show.c.Venue_id))
-            .filter(Show.c.Venue_id == venue_id)
-            .filter(Show.c.start_time < datetime.now())
-            .all())[0][0]
-
-        single_venue.upcoming_shows_count = (db.session.query(
-            func.count(Show.c.Venue_id))
-            .filter(Show.c.Venue_id == venue_id)
-            .filter(Show.c.start_time > datetime.now())
-            .all())[0][0]
+        # Counts are read from the venue row, the shows come from one query
+        shows = venue_shows_query(venue_id).all()
+        single_venue.past_shows, single_venue.upcoming_shows = partition_shows(
+            shows, datetime.now())
 
         return render_template('pages/show_venue.html', venue=single_venue)
 
@@ -276,9 +532,14 @@ def create_venue_submission():
 
             flash('Venue ' + request.form['name'] +
                   ' was successfully listed!')
+        except IntegrityError:
+            db.session.rollback()
+            flash('Venue ' + request.form['name'] + ' is already listed in ' +
+                  request.form['city'] + ', ' + request.form['state'] + '.')
         except:
+            db.session.rollback()
             flash('An error occurred. Venue ' +
-                  data.name + ' could not be listed.')
+                  request.form['name'] + ' could not be listed.')
         finally:
             db.session.close()
     else:
@@ -318,32 +579,28 @@ def delete_venue(venue_id):
 @app.route('/artists')
 def artists():
     # TODO: replace with real data returned from querying the database
-    sql = text("select * from Artist")
-    artists = db.engine.execute(sql)
-    artists_list = artists.fetchall()
+    page = keyset_page(artists_query(), [Artist.name, Artist.id],
+                       after=request.args.get('after'),
+                       before=request.args.get('before'),
+                       page_size=page_size_from(request.args))
 
-    return render_template('pages/artists.html', artists=artists_list)
+    return render_template('pages/artists.html', artists=page.items, page=page)
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
     # TODO: implement search on artists with partial string search. Ensure it is case-insensitive.
     # seach for "A" should return "Guns N Petals", "Matt Quevado", and "The Wild Sax Band".
     # search for "band" should return "The Wild Sax Band".
 
-    search_term = request.form.get('search_term', '')
-    search_artist_count = db.session.query(
-        func.count(Artist.id)).filter(Artist.name.contains(search_term)).all()
+    # Later pages are fetched with GET, carrying the term and a cursor
+    search_term = request.values.get('search_term', '')
+    response = search_backend().search(Artist, search_term,
+                                       after=request.values.get('after'),
+                                       before=request.values.get('before'),
+                                       page_size=page_size_from(request.values))
 
-    search_artist_result = Artist.query.filter(
-        Artist.name.contains(search_term)).all()
-
-    response = {
-        "count": search_artist_count[0][0],
-        "data": search_artist_result
-    }
-
-    return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
+    return render_template('pages/search_artists.html', results=response, page=response, search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
@@ -351,38 +608,13 @@ def show_artist(artist_id):
     # shows the venue page with the given venue_id
     # TODO: replace with real venue data from the venues table, using venue_id
     single_artist = Artist.query.get(artist_id)
+    if single_artist is None:
+        return not_found_error(404)
 
-    single_artist.past_shows = (db.session.query(
-        Venue.id.label("venue_id"),
-        Venue.name.label("venue_name"),
-        Venue.image_link.label("venue_image_link"),
-        Show)
-        .filter(Show.c.Artist_id == artist_id)
-        .filter(Show.c.Venue_id == Venue.id)
-        .filter(Show.c.start_time <= datetime.now())
-        .all())
-
-    single_artist.upcoming_shows = (db.session.query(
-        Venue.id.label("venue_id"),
-        Venue.name.label("venue_name"),
-        Venue.image_link.label("venue_image_link"),
-        Show)
-        .filter(Show.c.Artist_id == artist_id)
-        .filter(Show.c.Venue_id == Venue.id)
-        .filter(Show.c.start_time > datetime.now())
-        .all())
-
-    single_artist.past_shows_count = (db.session.query(
-        func.count(Show.c.Artist_id))
-        .filter(Show.c.Artist_id == artist_id)
-        .filter(Show.c.start_time < datetime.now())
-        .all())[0][0]
-
-    single_artist.upcoming_shows_count = (db.session.query(
-        func.count(Show.c.Artist_id))
-        .filter(Show.c.Artist_id == artist_id)
-        .filter(Show.c.start_time > datetime.now())
-        .all())[0][0]
+    # Counts are read from the artist row, the shows come from one query
+    shows = artist_shows_query(artist_id).all()
+    single_artist.past_shows, single_artist.upcoming_shows = partition_shows(
+        shows, datetime.now())
 
     return render_template('pages/show_artist.html', artist=single_artist)
 
@@ -415,17 +647,17 @@ def edit_artist_submission(artist_id):
     # TODO: take values from the form submitted, and update existing
     # artist record with ID <artist_id> using the new attributes
     try:
-        artist = Venue.query.get(artist_id)
-        artist.name = request.form['name'],
-        artist.city = request.form['city'],
-        artist.state = request.form['state'],
-        artist.phone = request.form['phone'],
-        artist.genres = request.form['genres'],
-        artist.facebook_link = request.form['facebook_link'],
-        artist.website = request.form['website'],
-        artist.image_link = request.form['image_link'],
-        artist.seeking_venue = request.form['seeking_venue'],
-        artist.seeking_description = request.form['seeking_description']
+        artist = Artist.query.get(artist_id)
+        artist.name = request.form['name']
+        artist.city = request.form['city']
+        artist.state = request.form['state']
+        artist.phone = request.form['phone']
+        artist.genres = request.form.getlist('genres')
+        artist.facebook_link = request.form['facebook_link']
+        artist.website = request.form.get('website')
+        artist.image_link = request.form.get('image_link')
+        artist.seeking_venue = 'seeking_venue' in request.form
+        artist.seeking_description = request.form.get('seeking_description')
 
         db.session.add(artist)
         db.session.commit()
@@ -466,17 +698,17 @@ def edit_venue_submission(venue_id):
     try:
         venue = Venue.query.get(venue_id)
 
-        venue.name = request.form['name'],
-        venue.city = request.form['city'],
-        venue.state = request.form['state'],
-        venue.address = request.form['address'],
-        venue.phone = request.form['phone'],
-        venue.genres = request.form.getlist('genres'),
+        venue.name = request.form['name']
+        venue.city = request.form['city']
+        venue.state = request.form['state']
+        venue.address = request.form['address']
+        venue.phone = request.form['phone']
+        venue.genres = request.form.getlist('genres')
         venue.facebook_link = request.form['facebook_link']
-        venue.website = request.form['website'],
-        venue.image_link = request.form['image_link'],
-        venue.seeking_talent = request.form['seeking_talent'],
-        venue.seeking_description = request.form['seeking_description']
+        venue.website = request.form.get('website')
+        venue.image_link = request.form.get('image_link')
+        venue.seeking_talent = 'seeking_talent' in request.form
+        venue.seeking_description = request.form.get('seeking_description')
 
         db.session.add(venue)
         db.session.commit()
@@ -528,10 +760,14 @@ def create_artist_submission():
 
             flash('Artist ' + request.form['name'] +
                   ' was successfully listed!')
+        except IntegrityError:
+            db.session.rollback()
+            flash('Artist ' + request.form['name'] + ' is already listed in ' +
+                  request.form['city'] + ', ' + request.form['state'] + '.')
         except:
-
+            db.session.rollback()
             flash('An error occurred. Artist ' +
-                  data.name + ' could not be listed.')
+                  request.form['name'] + ' could not be listed.')
         finally:
             db.session.close()
     else:
@@ -554,20 +790,14 @@ def shows():
     # TODO DONE: replace with real shows data.
     # TODO DONE: num_shows should be aggregated based on number of upcoming shows per venue.
 
-    # Make a database query to get all shows
+    # Make a database query to get one page of shows, in start time order
     # Rename Fields so frontend can access the correct values
-    data = (db.session.query(
-        Venue.id.label("venue_id"),
-        Venue.name.label("venue_name"),
-        Artist.id.label("artist_id"),
-        Artist.name.label("artist_name"),
-        Artist.image_link.label("artist_image_link"),
-        Show)
-        .filter(Show.c.Venue_id == Venue.id)
-        .filter(Show.c.Artist_id == Artist.id)
-        .all())
+    page = keyset_page(shows_query(), [Show.start_time, Show.id],
+                       after=request.args.get('after'),
+                       before=request.args.get('before'),
+                       page_size=page_size_from(request.args))
 
-    return render_template('pages/shows.html', shows=data)
+    return render_template('pages/shows.html', shows=page.items, page=page)
 
 
 @app.route('/shows/create')
@@ -585,12 +815,14 @@ def create_show_submission():
 
     if form.validate():
         try:
-            new_show = Show.insert().values(
+            new_show = Show(
                 Venue_id=request.form['venue_id'],
                 Artist_id=request.form['artist_id'],
-                start_time=request.form['start_time']
+                start_time=form.start_time.data
             )
-            db.session.execute(new_show)
+            record_new_show(new_show.Venue_id,
+                            new_show.Artist_id, new_show.start_time)
+            db.session.add(new_show)
             db.session.commit()
 
             flash('Show was successfully listed!')
@@ -610,11 +842,126 @@ def create_show_submission():
     return render_template('pages/home.html')
 
 
+@app.route('/shows/import', methods=['POST'])
+def import_shows_submission():
+    # Bulk import for booking partners, authenticated with the
+    # IMPORT_API_TOKEN bearer token. The body is a CSV or NDJSON feed
+    # (Content-Type text/csv or application/x-ndjson), read as it arrives.
+    denied = check_import_token()
+    if denied:
+        return denied
+
+    report = import_shows(request_lines(), feed_format(request.mimetype),
+                          request.args.get('batch_size', type=int))
+    # 400 when the feed stopped being readable, its line is in the errors
+    return jsonify(dict(report.to_dict(), success=not report.error_count)), (
+        400 if report.feed_error else 200)
+
+
+@app.route('/<any(venues, artists):kind>/upsert', methods=['POST'])
+def upsert_catalogue_submission(kind):
+    # Bulk create or update of venues or artists, matched on name, city and
+    # state. Same authentication and feed formats as /shows/import.
+    denied = check_import_token()
+    if denied:
+        return denied
+
+    report = upsert_catalogue(kind, request_lines(), feed_format(request.mimetype),
+                              request.args.get('batch_size', type=int))
+    return jsonify(dict(report.to_dict(), success=not report.error_count)), (
+        400 if report.feed_error else 200)
+
+
+def check_import_token():
+    # Returns the error response of a bulk request without the
+    # IMPORT_API_TOKEN bearer token, None when the token is right
+    token = app.config.get('IMPORT_API_TOKEN')
+    if not token:
+        return jsonify({'success': False, 'message': 'Bulk imports are disabled'}), 403
+    authorization = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(authorization.encode(), 'Bearer {}'.format(token).encode()):
+        return jsonify({'success': False, 'message': 'Invalid import token'}), 401
+    return None
+
+
+def request_lines():
+    # The request body, read and decoded line by line as it arrives
+    return decode_lines(request.stream)
+
+
+#  Debug
+#  ----------------------------------------------------------------
+
+@app.route('/debug/pool')
+def debug_pool():
+    # Connection pool counters and checkout wait times, see db_engine.py.
+    # Pool internals are only exposed in debug mode, or with DEBUG_POOL=1
+    if not (app.debug or app.config.get('DEBUG_POOL')):
+        return not_found_error(404)
+    return jsonify(pool_stats(db.engine))
+
+
+#  Commands
+#  ----------------------------------------------------------------
+
+@app.cli.command('roll-show-counters')
+def roll_show_counters_command():
+    # Meant to be run periodically, e.g. every minute from cron
+    moved = roll_show_counters()
+    print('{} shows moved to the past counters'.format(moved))
+
+
+@app.cli.command('rebuild-show-counters')
+def rebuild_show_counters_command():
+    state = rebuild_show_counters()
+    db.session.commit()
+    print(state)
+
+
+@app.cli.command('import-shows')
+@click.argument('feed', type=click.File('rb'))
+@click.option('--format', 'feed_type', type=click.Choice(sorted(READERS)),
+              help='Feed format, guessed from the file name by default.')
+@click.option('--batch-size', type=int, help='Rows per INSERT and transaction.')
+def import_shows_command(feed, feed_type, batch_size):
+    # Imports a nightly feed of shows, e.g. flask import-shows shows.csv
+    report = import_shows(decode_lines(feed), feed_type or feed_format(feed.name), batch_size)
+    for error in report.errors:
+        print('line {line}: {error}'.format(**error))
+    print('{} rows, {} imported, {} errors in {:.1f}s ({:.0f} rows/s)'.format(
+        report.rows, report.imported, report.error_count, report.seconds,
+        report.rows_per_second))
+
+
+@app.cli.command('upsert-catalogue')
+@click.argument('kind', type=click.Choice(sorted(CATALOGUES)))
+@click.argument('feed', type=click.File('rb'))
+@click.option('--format', 'feed_type', type=click.Choice(sorted(READERS)),
+              help='Feed format, guessed from the file name by default.')
+@click.option('--batch-size', type=int, help='Records per statement and transaction.')
+def upsert_catalogue_command(kind, feed, feed_type, batch_size):
+    # Creates or updates venues or artists in bulk,
+    # e.g. flask upsert-catalogue artists artists.csv
+    report = upsert_catalogue(kind, decode_lines(feed), feed_type or feed_format(feed.name),
+                              batch_size)
+    for error in report.errors:
+        print('line {line}: {error}'.format(**error))
+    for number, batch in enumerate(report.batches, 1):
+        print('batch {}: {rows} rows, {written} written in {ms:.1f}ms'.format(number, **batch))
+    print('{} rows, {} duplicates, {} written, {} errors in {:.1f}s'.format(
+        report.rows, report.duplicates, report.written, report.error_count, report.seconds))
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 
+@app.errorhandler(InvalidCursor)
+def invalid_cursor_error(error):
+    return not_found_error(error)
+
+
 @app.errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
@@ -0,0 +1,183 @@
+#----------------------------------------------------------------------------#
+# Benchmarks for Fyyur, without a database:
+#
+#   python benchmarks.py render forms
+#----------------------------------------------------------------------------#
+
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from statistics import median
+
+import babel.dates
+import dateutil.parser
+from flask import render_template
+from werkzeug.datastructures import MultiDict
+from wtforms import SelectField, SelectMultipleField
+from wtforms.validators import DataRequired
+
+from app import app
+from catalogue_import import FormRules
+from date_format import format_datetime
+from forms import CHOICES, VenueForm
+from pagination import Page
+
+SHOWS = 1000
+RENDERS = 20
+SUBMISSIONS = 10000
+FORM_RUNS = 5
+
+ShowRow = namedtuple('ShowRow', 'id start_time venue_id venue_name artist_id '
+                                'artist_name artist_image_link')
+
+
+def babel_format_datetime(value, format='medium'):
+    # The filter as it was before date_format.py: the value went through a
+    # string, and babel parsed the pattern and looked up the locale each call
+    date = dateutil.parser.parse(str(value))
+    if format == 'full':
+        format = "EEEE MMMM, d, y 'at' h:mma"
+    elif format == 'medium':
+        format = "EE MM, dd, y h:mma"
+    return babel.dates.format_datetime(date, format, locale='en')
+
+
+def clear_cache():
+    format_datetime.cache_clear()
+
+
+def benchmark_render():
+    """
+    time to render a /shows page of SHOWS shows with each |datetime filter
+    """
+    start = datetime(2021, 5, 1, 20)
+    shows = [ShowRow(i, start + timedelta(hours=i), 1, 'The Musical Hop', 1,
+                     'Guns N Petals', '') for i in range(SHOWS)]
+    filters = [
+        ('babel per call', babel_format_datetime, None),
+        ('compiled, cold cache', format_datetime, clear_cache),
+        ('compiled, warm cache', format_datetime, None),
+    ]
+    print('{:>22} {:>14} {:>14}'.format('filter', 'median (ms)', 'per show (us)'))
+
+    with app.test_request_context('/shows'):
+        for name, date_filter, before_render in filters:
+            app.jinja_env.filters['datetime'] = date_filter
+            timings = []
+            for _ in range(RENDERS):
+                if before_render:
+                    before_render()
+                started = time.perf_counter()
+                render_template('pages/shows.html', shows=shows,
+                                page=Page(shows, None, None))
+                timings.append(time.perf_counter() - started)
+            print('{:>22} {:>14.3f} {:>14.3f}'.format(
+                name, median(timings) * 1000, median(timings) * 1e6 / SHOWS))
+    app.jinja_env.filters['datetime'] = format_datetime
+
+
+class ListChoicesVenueForm(VenueForm):
+    # The select fields as they were before the choices registry: each form
+    # copies the choices into a list and scans it to validate a value
+    state = SelectField(
+        'state', validators=[DataRequired()],
+        choices=[(value, label) for value, label in CHOICES['state']]
+    )
+    genres = SelectMultipleField(
+        'genres', validators=[DataRequired()],
+        choices=[(value, label) for value, label in CHOICES['genres']]
+    )
+
+
+def venue_submissions():
+    genres = [value for value, _ in CHOICES['genres']]
+    states = [value for value, _ in CHOICES['state']]
+    submissions = []
+    for i in range(SUBMISSIONS):
+        submission = {
+            'name': 'Venue {}'.format(i),
+            'city': 'San Francisco',
+            'state': states[i % len(states)],
+            'address': '{} Market Street'.format(i),
+            'phone': '123-123-1234',
+            'website': 'https://venue{}.example.com'.format(i),
+            'image_link': 'https://images.example.com/{}.jpg'.format(i),
+            'facebook_link': 'https://www.facebook.com/venue{}'.format(i),
+            'seeking_description': '',
+            # The last genres of the list, the worst case of a scan
+            'genres': genres[-1 - i % 4:],
+        }
+        if i % 10 == 0:
+            submission['genres'] = submission['genres'] + ['Polka']
+        submissions.append(submission)
+    return submissions
+
+
+def benchmark_forms():
+    """
+    venue submissions checked per second, SUBMISSIONS submissions, one in
+    ten with an unknown genre. Each path runs FORM_RUNS times, interleaved
+    with the others, and the median run is reported.
+
+    'choice checks' only runs the state and genres checks of forms that are
+    already built, which is what the choices registry changes; 'submission'
+    builds and validates a whole form per submission.
+    """
+    submissions = venue_submissions()
+    formdata = [MultiDict([(key, value) for key, values in submission.items()
+                           for value in (values if isinstance(values, list) else [values])])
+                for submission in submissions]
+    rules = FormRules(VenueForm)
+
+    def validate_forms(form_class):
+        return sum(form_class(data, meta={'csrf': False}).validate()
+                   for data in formdata)
+
+    def check_choices(forms):
+        valid = 0
+        for form in forms:
+            try:
+                form.state.pre_validate(form)
+                form.genres.pre_validate(form)
+                valid += 1
+            except ValueError:
+                pass
+        return valid
+
+    with app.test_request_context('/venues/create', method='POST'):
+        list_forms = [ListChoicesVenueForm(data, meta={'csrf': False}) for data in formdata]
+        registry_forms = [VenueForm(data, meta={'csrf': False}) for data in formdata]
+        paths = [
+            ('choice checks', 'list choices form', lambda: check_choices(list_forms)),
+            ('choice checks', 'registry form', lambda: check_choices(registry_forms)),
+            ('submission', 'list choices form', lambda: validate_forms(ListChoicesVenueForm)),
+            ('submission', 'registry form', lambda: validate_forms(VenueForm)),
+            ('submission', 'form rules, no form', lambda: sum(
+                not rules.validate(submission)[1] for submission in submissions)),
+        ]
+        timings = {(check, name): [] for check, name, _ in paths}
+        valid = {}
+        for _ in range(FORM_RUNS):
+            for check, name, run in paths:
+                started = time.perf_counter()
+                valid[check, name] = run()
+                timings[check, name].append(time.perf_counter() - started)
+
+    print('{:>14} {:>22} {:>8} {:>13} {:>12}'.format(
+        'check', 'path', 'valid', 'median (ms)', 'per second'))
+    for check, name, _ in paths:
+        elapsed = median(timings[check, name])
+        print('{:>14} {:>22} {:>8} {:>13.1f} {:>12.0f}'.format(
+            check, name, valid[check, name], elapsed * 1000, SUBMISSIONS / elapsed))
+
+
+BENCHMARKS = {
+    'render': benchmark_render,
+    'forms': benchmark_forms,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print('# {}'.format(name))
+        BENCHMARKS[name]()
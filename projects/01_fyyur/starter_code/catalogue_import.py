@@ -0,0 +1,254 @@
+#----------------------------------------------------------------------------#
+# Bulk venue and artist upserts.
+#
+# Records are checked with the rules of VenueForm / ArtistForm, read once
+# from the form class: required fields, URLs and the state and genres
+# choices are validated the way the forms do it, without building a form
+# per record.
+#
+# Records are read and written batch by batch, so an import holds one batch
+# in memory whatever the size of the feed. Within a batch they are
+# deduplicated on their natural key (name, city, state), the last one wins;
+# a record repeated in a later batch updates the row written by the earlier
+# one. Batches are written with
+#
+#   INSERT ... ON CONFLICT (name, city, state) DO UPDATE
+#
+# on Postgres, which bumps version_id so cached fragments of the updated
+# rows are dropped. Other databases look the keys up and split each batch
+# into an UPDATE and an INSERT. Every batch is its own transaction and its
+# time is reported.
+#----------------------------------------------------------------------------#
+
+import time
+
+from sqlalchemy import bindparam, tuple_
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError
+from wtforms.fields import BooleanField, SelectFieldBase, SelectMultipleField
+from wtforms.fields.core import UnboundField
+from wtforms.validators import StopValidation, ValidationError
+
+from forms import Choices
+from show_import import FeedError
+
+BATCH_SIZE = 500
+NATURAL_KEY = ('name', 'city', 'state')
+# Records kept in UpsertReport.errors, later errors are only counted
+MAX_REPORTED_ERRORS = 1000
+
+TRUE_VALUES = {True, 'y', 'yes', 'true', 'on', '1', 1}
+
+
+class Value:
+    # The part of a wtforms field the validators use
+    def __init__(self, data):
+        self.data = data
+        self.errors = []
+
+    def gettext(self, string):
+        return string
+
+
+class FieldRule:
+    def __init__(self, name, field_class, validators, choices):
+        self.name = name
+        self.multiple = issubclass(field_class, SelectMultipleField)
+        self.boolean = issubclass(field_class, BooleanField)
+        self.validators = validators
+        if isinstance(choices, Choices):
+            self.choices = choices.values
+        elif choices is not None:
+            self.choices = frozenset(value for value, _ in choices)
+        else:
+            self.choices = None
+
+    def coerce(self, value):
+        if self.boolean:
+            if isinstance(value, str):
+                value = value.strip().lower()
+            return value in TRUE_VALUES
+        if self.multiple:
+            if isinstance(value, str):
+                value = [part.strip() for part in value.split(',')]
+            return [part for part in value or () if part]
+        if value is None:
+            return None
+        return str(value).strip()
+
+    def check(self, data):
+        """Returns the error message for data, None when it is valid"""
+        value = Value(data)
+        for validator in self.validators:
+            try:
+                validator(None, value)
+            except StopValidation as error:
+                return str(error) or None
+            except ValidationError as error:
+                return str(error)
+        if self.choices is not None and data:
+            for choice in (data if self.multiple else [data]):
+                if choice not in self.choices:
+                    return "'{}' is not a valid choice for this field".format(choice)
+        return None
+
+
+class FormRules:
+    """The validation rules of a wtforms form class"""
+
+    def __init__(self, form_class):
+        self.form_class = form_class
+        self.fields = []
+        for name in dir(form_class):
+            unbound = getattr(form_class, name)
+            if not isinstance(unbound, UnboundField):
+                continue
+            kwargs = unbound.kwargs
+            choices = None
+            if issubclass(unbound.field_class, SelectFieldBase):
+                choices = kwargs.get('choices', ())
+            self.fields.append(FieldRule(
+                name, unbound.field_class, list(kwargs.get('validators') or ()), choices))
+
+    def validate(self, record):
+        """Returns the cleaned record and a dict of field errors"""
+        cleaned = {}
+        errors = {}
+        for field in self.fields:
+            data = field.coerce(record.get(field.name))
+            message = field.check(data)
+            if message:
+                errors[field.name] = message
+            cleaned[field.name] = data
+        return cleaned, errors
+
+
+class UpsertReport:
+    def __init__(self):
+        self.rows = 0
+        self.duplicates = 0
+        self.written = 0
+        self.error_count = 0
+        self.errors = []
+        self.batches = []
+        # Set when the upsert stopped on a FeedError
+        self.feed_error = False
+        self.seconds = 0.0
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': message})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'duplicates': self.duplicates,
+            'written': self.written,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'batches': self.batches,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows / self.seconds, 1) if self.seconds else 0.0,
+        }
+
+
+def natural_key(record):
+    return tuple(record[column] for column in NATURAL_KEY)
+
+
+class CatalogueUpserter:
+    """Validates records with the rules of form_class and upserts them into
+    the table of model"""
+
+    def __init__(self, session, model, form_class, batch_size=BATCH_SIZE):
+        self.session = session
+        self.table = model.__table__
+        self.rules = FormRules(form_class)
+        self.batch_size = batch_size
+
+    def run(self, records):
+        """Upserts the (line number, record) pairs, as yielded by the readers
+        of show_import.py, and returns an UpsertReport"""
+        report = UpsertReport()
+        started = time.perf_counter()
+        # Validated records of the batch by natural key, in first seen order
+        batch = {}
+        try:
+            for line_number, record in records:
+                report.rows += 1
+                if isinstance(record, Exception):
+                    report.error(line_number, str(record))
+                    continue
+                cleaned, errors = self.rules.validate(record)
+                if errors:
+                    report.error(line_number, errors)
+                    continue
+                key = natural_key(cleaned)
+                if key in batch:
+                    report.duplicates += 1
+                batch[key] = cleaned
+                if len(batch) >= self.batch_size:
+                    self.write_batch(list(batch.values()), report)
+                    batch = {}
+        except FeedError as error:
+            report.error(error.line_number, str(error))
+            report.feed_error = True
+        if batch:
+            self.write_batch(list(batch.values()), report)
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def write_batch(self, batch, report):
+        started = time.perf_counter()
+        try:
+            if self.session.get_bind().dialect.name == 'postgresql':
+                self.upsert_on_conflict(batch)
+            else:
+                self.upsert_by_lookup(batch)
+            self.session.commit()
+        except SQLAlchemyError as error:
+            self.session.rollback()
+            report.error(None, 'batch {} failed: {}'.format(len(report.batches) + 1, error))
+            written = 0
+        else:
+            written = len(batch)
+        report.written += written
+        report.batches.append({
+            'rows': len(batch),
+            'written': written,
+            'ms': round((time.perf_counter() - started) * 1000, 3),
+        })
+
+    def upsert_on_conflict(self, batch):
+        insert = postgresql.insert(self.table).values(batch)
+        updated = {column: insert.excluded[column] for column in batch[0]
+                   if column not in NATURAL_KEY}
+        updated['version_id'] = self.table.c.version_id + 1
+        self.session.execute(insert.on_conflict_do_update(
+            index_elements=list(NATURAL_KEY), set_=updated))
+
+    def upsert_by_lookup(self, batch):
+        key_columns = [self.table.c[column] for column in NATURAL_KEY]
+        # Expanding parameters keep the statements small, however big the batch
+        existing = dict(
+            (tuple(row[:-1]), row[-1]) for row in self.session.execute(
+                self.table.select()
+                .with_only_columns(key_columns + [self.table.c.id])
+                .where(tuple_(*key_columns).in_(bindparam('keys', expanding=True))),
+                {'keys': [natural_key(record) for record in batch]}))
+        inserted = [record for record in batch if natural_key(record) not in existing]
+        # Bound parameters can't be named after the columns they set
+        updated = [dict({'b_' + column: value for column, value in record.items()},
+                        b_id=existing[natural_key(record)])
+                   for record in batch if natural_key(record) in existing]
+        if updated:
+            self.session.execute(
+                self.table.update()
+                .where(self.table.c.id == bindparam('b_id'))
+                .values(version_id=self.table.c.version_id + 1,
+                        **{column: bindparam('b_' + column) for column in batch[0]
+                           if column not in NATURAL_KEY}),
+                updated)
+        if inserted:
+            self.session.execute(self.table.insert(), inserted)
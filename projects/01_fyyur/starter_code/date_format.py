@@ -0,0 +1,42 @@
+#----------------------------------------------------------------------------#
+# Date and time formatting for the templates' |datetime filter.
+#
+# babel.dates.format_datetime() parses its pattern and looks up its locale
+# on every call, which adds up on pages listing hundreds of shows. Here each
+# (locale, format) pair is compiled once, and formatted values are memoized
+# in a bounded LRU cache, since the same start times repeat across pages and
+# requests. Values are datetimes as loaded from the database; strings are
+# still accepted and parsed with dateutil.
+#----------------------------------------------------------------------------#
+
+from datetime import datetime
+from functools import lru_cache
+
+import dateutil.parser
+from babel import Locale
+from babel.dates import parse_pattern
+
+LOCALE = 'en'
+
+# Named formats, any other format is used as a babel pattern
+FORMATS = {
+    'full': "EEEE MMMM, d, y 'at' h:mma",
+    'medium': "EE MM, dd, y h:mma",
+}
+
+# Formatted values kept by format_datetime()
+CACHE_SIZE = 4096
+
+
+@lru_cache(maxsize=64)
+def compiled_pattern(format, locale=LOCALE):
+    """Returns the parsed babel pattern and locale for a format"""
+    return parse_pattern(FORMATS.get(format, format)), Locale.parse(locale)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def format_datetime(value, format='medium', locale=LOCALE):
+    if not isinstance(value, datetime):
+        value = dateutil.parser.parse(value)
+    pattern, locale = compiled_pattern(format, locale)
+    return pattern.apply(value, locale)
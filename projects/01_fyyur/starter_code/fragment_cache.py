@@ -0,0 +1,178 @@
+#----------------------------------------------------------------------------#
+# Jinja fragment cache.
+#
+# Wrapping part of a template in
+#
+#   {% cache venue, 3600 %} ... {% endcache %}
+#
+# renders it once and serves it from the cache for up to 3600 seconds (0 or
+# no ttl for no limit). The key is made of the template, the block's line
+# and the key expression. Rows in the key stand for their table, primary key
+# and version_id, a column SQLAlchemy increments on every ORM update, so
+# editing a venue or an artist gives its fragments a new key. The stale ones
+# are never served again, they are evicted by the lru backend and left for
+# the tmp cleaner by the filesystem one.
+#
+#   FRAGMENT_CACHE       'lru' (in-process), 'filesystem' or 'none' ('lru')
+#   FRAGMENT_CACHE_SIZE  fragments kept by the lru backend (1024)
+#   FRAGMENT_CACHE_DIR   directory of the filesystem backend, which is
+#                        shared by every worker on the machine
+#----------------------------------------------------------------------------#
+
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Lock
+
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+from sqlalchemy import inspect
+from sqlalchemy.orm.state import InstanceState
+
+
+def expiry(ttl):
+    return time.time() + ttl if ttl else 0
+
+
+class LRUBackend:
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.lock = Lock()
+        self.entries = OrderedDict()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires and expires < time.time():
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            self.entries[key] = (expiry(ttl), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class FileSystemBackend:
+    # One file per fragment, named after the hash of its key. The first line
+    # holds the expiry time.
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, key):
+        return os.path.join(self.directory,
+                            hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, key):
+        try:
+            with open(self.path(key), encoding='utf-8') as cached:
+                expires = float(cached.readline())
+                if expires and expires < time.time():
+                    return None
+                return cached.read()
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value, ttl=None):
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(descriptor, 'w', encoding='utf-8') as cached:
+            cached.write('{}\n'.format(expiry(ttl)))
+            cached.write(value)
+        # Readers see the old file or the new one, never a partial write
+        os.replace(temporary, self.path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            os.remove(os.path.join(self.directory, name))
+
+
+class NullBackend:
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def clear(self):
+        pass
+
+
+def fragment_key(value):
+    """Turns a cache block's key into a string, rows become
+    table:primary key:v<version_id>"""
+    if isinstance(value, (list, tuple)):
+        return ':'.join(fragment_key(part) for part in value)
+    state = inspect(value, raiseerr=False)
+    if not isinstance(state, InstanceState):
+        return str(value)
+    mapper = state.mapper
+    identity = ','.join(str(part) for part in state.identity or ())
+    version = ''
+    if mapper.version_id_col is not None:
+        version = ':v{}'.format(getattr(
+            value, mapper.get_property_by_column(mapper.version_id_col).key))
+    return '{}:{}{}'.format(mapper.local_table.name, identity, version)
+
+
+class FragmentCacheExtension(Extension):
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=LRUBackend())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [nodes.Const('{}:{}'.format(parser.name, lineno)),
+                parser.parse_expression()]
+        if parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        else:
+            args.append(nodes.Const(None))
+        body = parser.parse_statements(['name:endcache'], drop_needle=True)
+        return nodes.CallBlock(self.call_method('_cache_support', args),
+                               [], [], body).set_lineno(lineno)
+
+    def _cache_support(self, location, key, ttl, caller):
+        key = '{}:{}'.format(location, fragment_key(key))
+        cache = self.environment.fragment_cache
+        value = cache.get(key)
+        if value is None:
+            value = caller()
+            cache.set(key, str(value), ttl)
+        return Markup(value)
+
+
+def fragment_cache_backend(config):
+    backend = config['FRAGMENT_CACHE']
+    if backend == 'lru':
+        return LRUBackend(config['FRAGMENT_CACHE_SIZE'])
+    if backend == 'filesystem':
+        return FileSystemBackend(config['FRAGMENT_CACHE_DIR'])
+    if backend == 'none':
+        return NullBackend()
+    raise ValueError('Unknown FRAGMENT_CACHE backend {!r}'.format(backend))
+
+
+def init_fragment_cache(app, backend=None):
+    app.config.setdefault('FRAGMENT_CACHE', 'lru')
+    app.config.setdefault('FRAGMENT_CACHE_SIZE', 1024)
+    app.config.setdefault('FRAGMENT_CACHE_DIR', os.path.join(
+        tempfile.gettempdir(), 'fyyur-fragments'))
+    app.jinja_env.add_extension(FragmentCacheExtension)
+    app.jinja_env.fragment_cache = backend or fragment_cache_backend(app.config)
@@ -0,0 +1,51 @@
+"""Add upcoming/past show counters.
+
+Revision ID: 5f2c1d7a9b34
+Revises: cf4b6085a513
+Create Date: 2026-10-18 10:12:41.503817
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f2c1d7a9b34'
+down_revision = 'cf4b6085a513'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.add_column(table, sa.Column('upcoming_shows_count', sa.Integer(),
+                                       nullable=False, server_default='0'))
+        op.add_column(table, sa.Column('past_shows_count', sa.Integer(),
+                                       nullable=False, server_default='0'))
+    op.create_table('ShowCounterState',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_until', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # Backfill the counters from the existing shows
+    op.execute('INSERT INTO "ShowCounterState" (id, rolled_until) VALUES (1, LOCALTIMESTAMP)')
+    for table, show_column in (('Venue', 'Venue_id'), ('Artist', 'Artist_id')):
+        op.execute('''
+            UPDATE "{table}" SET
+                upcoming_shows_count = (
+                    SELECT count(*) FROM "Show"
+                    WHERE "Show"."{show_column}" = "{table}".id
+                    AND "Show".start_time > (SELECT rolled_until FROM "ShowCounterState" WHERE id = 1)),
+                past_shows_count = (
+                    SELECT count(*) FROM "Show"
+                    WHERE "Show"."{show_column}" = "{table}".id
+                    AND "Show".start_time <= (SELECT rolled_until FROM "ShowCounterState" WHERE id = 1))
+        '''.format(table=table, show_column=show_column))
+
+
+def downgrade():
+    op.drop_table('ShowCounterState')
+    for table in ('Artist', 'Venue'):
+        op.drop_column(table, 'past_shows_count')
+        op.drop_column(table, 'upcoming_shows_count')
@@ -0,0 +1,31 @@
+"""Add a primary key and composite indexes to Show.
+
+Revision ID: 8d41e0b6c2a7
+Revises: 5f2c1d7a9b34
+Create Date: 2026-10-18 11:02:17.284671
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e0b6c2a7'
+down_revision = '5f2c1d7a9b34'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SERIAL numbers the existing rows as well
+    op.execute('ALTER TABLE "Show" ADD COLUMN id SERIAL PRIMARY KEY')
+    op.create_index('ix_Show_Venue_id_start_time', 'Show',
+                    ['Venue_id', 'start_time'], unique=False)
+    op.create_index('ix_Show_Artist_id_start_time', 'Show',
+                    ['Artist_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_Artist_id_start_time', table_name='Show')
+    op.drop_index('ix_Show_Venue_id_start_time', table_name='Show')
+    op.drop_column('Show', 'id')
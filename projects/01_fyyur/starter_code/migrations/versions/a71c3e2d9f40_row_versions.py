@@ -0,0 +1,26 @@
+"""Add row versions to venues and artists, keying their cached fragments.
+
+Revision ID: a71c3e2d9f40
+Revises: e6a07c3d58f1
+Create Date: 2026-10-18 14:02:37.540112
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a71c3e2d9f40'
+down_revision = 'e6a07c3d58f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('Venue', sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+    op.add_column('Artist', sa.Column('version_id', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade():
+    op.drop_column('Artist', 'version_id')
+    op.drop_column('Venue', 'version_id')
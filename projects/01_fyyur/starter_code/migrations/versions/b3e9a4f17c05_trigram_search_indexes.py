@@ -0,0 +1,39 @@
+"""Add trigram search indexes on Venue and Artist.
+
+Revision ID: b3e9a4f17c05
+Revises: 8d41e0b6c2a7
+Create Date: 2026-10-18 11:47:53.910442
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3e9a4f17c05'
+down_revision = '8d41e0b6c2a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    # array_to_string() is not IMMUTABLE, so genres are indexed through
+    # this wrapper (see search.py)
+    op.execute('''
+        CREATE OR REPLACE FUNCTION fyyur_genres_text(varchar[]) RETURNS text AS $$
+            SELECT array_to_string($1, ' ')
+        $$ LANGUAGE sql IMMUTABLE
+    ''')
+    for table in ('Venue', 'Artist'):
+        op.execute('CREATE INDEX "ix_{0}_name_trgm" ON "{0}" USING gin (name gin_trgm_ops)'.format(table))
+        op.execute('CREATE INDEX "ix_{0}_city_trgm" ON "{0}" USING gin (city gin_trgm_ops)'.format(table))
+        op.execute('CREATE INDEX "ix_{0}_genres_trgm" ON "{0}" USING gin (fyyur_genres_text(genres) gin_trgm_ops)'.format(table))
+
+
+def downgrade():
+    for table in ('Artist', 'Venue'):
+        op.drop_index('ix_{}_genres_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{}_city_trgm'.format(table), table_name=table)
+        op.drop_index('ix_{}_name_trgm'.format(table), table_name=table)
+    op.execute('DROP FUNCTION fyyur_genres_text(varchar[])')
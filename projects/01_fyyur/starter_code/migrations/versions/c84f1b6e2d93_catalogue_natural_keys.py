@@ -0,0 +1,27 @@
+"""Make name, city and state unique for venues and artists, for bulk upserts.
+
+Revision ID: c84f1b6e2d93
+Revises: a71c3e2d9f40
+Create Date: 2026-10-18 15:10:52.802315
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c84f1b6e2d93'
+down_revision = 'a71c3e2d9f40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Fails while duplicates exist, merge them before upgrading
+    op.create_unique_constraint('uq_Venue_name_city_state', 'Venue', ['name', 'city', 'state'])
+    op.create_unique_constraint('uq_Artist_name_city_state', 'Artist', ['name', 'city', 'state'])
+
+
+def downgrade():
+    op.drop_constraint('uq_Artist_name_city_state', 'Artist', type_='unique')
+    op.drop_constraint('uq_Venue_name_city_state', 'Venue', type_='unique')
@@ -0,0 +1,34 @@
+"""Add indexes for keyset pagination of artists and shows, and make their
+sort keys NOT NULL.
+
+Revision ID: e6a07c3d58f1
+Revises: b3e9a4f17c05
+Create Date: 2026-10-18 12:31:06.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6a07c3d58f1'
+down_revision = 'b3e9a4f17c05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Row comparisons skip NULL sort keys, so the pages would never show
+    # such rows. Fails while artists without a name or shows without a start
+    # time exist, fix or delete them before upgrading
+    op.alter_column('Artist', 'name', existing_type=sa.String(), nullable=False)
+    op.alter_column('Show', 'start_time', existing_type=sa.DateTime(), nullable=False)
+    op.create_index('ix_Artist_name_id', 'Artist', ['name', 'id'], unique=False)
+    op.create_index('ix_Show_start_time_id', 'Show', ['start_time', 'id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_Show_start_time_id', table_name='Show')
+    op.drop_index('ix_Artist_name_id', table_name='Artist')
+    op.alter_column('Show', 'start_time', existing_type=sa.DateTime(), nullable=True)
+    op.alter_column('Artist', 'name', existing_type=sa.String(), nullable=True)
@@ -0,0 +1,123 @@
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#
+# Pages are fetched by seeking past the sort key of the last row shown,
+# e.g. WHERE (start_time, id) > (:start_time, :id) ORDER BY start_time, id
+# LIMIT n, which stays as cheap on the last page as on the first as long as
+# an index covers the sort key. The sort keys must be ascending and unique
+# together, so they always end with the primary key, and NOT NULL: a row
+# comparison with a NULL is never true, so rows with a NULL key would be
+# on no page.
+#
+# Cursors are opaque url-safe tokens holding the sort key of the first or
+# last row of the current page.
+#----------------------------------------------------------------------------#
+
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import DateTime, tuple_
+
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class Page(namedtuple('Page', 'items next_cursor prev_cursor')):
+    pass
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def page_size_from(args):
+    page_size = args.get('page_size', PAGE_SIZE, type=int)
+    return min(max(page_size, 1), MAX_PAGE_SIZE)
+
+
+def encode_cursor(values):
+    values = [value.isoformat() if isinstance(value, datetime) else value
+              for value in values]
+    return base64.urlsafe_b64encode(
+        json.dumps(values, separators=(',', ':')).encode()).decode()
+
+
+def decode_cursor(token, keys):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor(token)
+    if not isinstance(values, list) or len(values) != len(keys):
+        raise InvalidCursor(token)
+
+    decoded = []
+    for key, value in zip(keys, values):
+        if isinstance(key.type, DateTime) and value is not None:
+            try:
+                value = datetime.fromisoformat(value)
+            except (ValueError, TypeError):
+                raise InvalidCursor(token)
+        decoded.append(value)
+    return decoded
+
+
+def row_key(row, keys):
+    return [getattr(row, key.key) for key in keys]
+
+
+def keyset_page(query, keys, after=None, before=None, page_size=PAGE_SIZE):
+    # Returns the page of rows following the <after> cursor, or preceding the
+    # <before> cursor, or the first page when neither is given
+    if before:
+        values = decode_cursor(before, keys)
+        rows = (query
+                .filter(tuple_(*keys) < tuple_(*values))
+                .order_by(*[key.desc() for key in keys])
+                .limit(page_size + 1)
+                .all())
+        has_more = len(rows) > page_size
+        items = list(reversed(rows[:page_size]))
+        return Page(
+            items,
+            encode_cursor(row_key(items[-1], keys)) if items else None,
+            encode_cursor(row_key(items[0], keys)) if items and has_more else None)
+
+    if after:
+        values = decode_cursor(after, keys)
+        query = query.filter(tuple_(*keys) > tuple_(*values))
+    rows = query.order_by(*keys).limit(page_size + 1).all()
+    has_more = len(rows) > page_size
+    items = rows[:page_size]
+    return Page(
+        items,
+        encode_cursor(row_key(items[-1], keys)) if items and has_more else None,
+        encode_cursor(row_key(items[0], keys)) if items and after else None)
+
+
+def keyset_slice(items, sort_key, after=None, before=None, page_size=PAGE_SIZE):
+    # Same as keyset_page(), over an in-memory list sorted by sort_key
+    def load(token):
+        try:
+            return tuple(json.loads(base64.urlsafe_b64decode(token.encode())))
+        except (ValueError, TypeError):
+            raise InvalidCursor(token)
+
+    if before:
+        values = load(before)
+        preceding = [item for item in items if tuple(sort_key(item)) < values]
+        page = preceding[-page_size:]
+        return Page(
+            page,
+            encode_cursor(sort_key(page[-1])) if page else None,
+            encode_cursor(sort_key(page[0])) if page and len(preceding) > page_size else None)
+
+    if after:
+        values = load(after)
+        items = [item for item in items if tuple(sort_key(item)) > values]
+    page = items[:page_size]
+    return Page(
+        page,
+        encode_cursor(sort_key(page[-1])) if page and len(items) > page_size else None,
+        encode_cursor(sort_key(page[0])) if page and after else None)
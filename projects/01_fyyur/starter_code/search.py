@@ -0,0 +1,187 @@
+#----------------------------------------------------------------------------#
+# Venue and artist search.
+#
+# Searches are case-insensitive partial matches on name, city and genres,
+# ranked by relevance. The total count and the results come back from a
+# single query, a page at a time (see pagination.py). Backends are pluggable:
+#
+#   PostgresSearchBackend  ILIKE served by pg_trgm GIN indexes, ranked by
+#                          trigram word similarity
+#   LikeSearchBackend      portable LIKE on lower(...) for SQLite and other
+#                          databases without pg_trgm (name and city only)
+#   InMemorySearchBackend  matches in Python over plain records, so tests
+#                          can run without a database
+#----------------------------------------------------------------------------#
+
+from sqlalchemy import DDL, case, event, func, or_
+
+from pagination import PAGE_SIZE, keyset_page, keyset_slice
+
+# Genres are stored as an array, array_to_string() is not IMMUTABLE and so
+# cannot be indexed directly
+GENRES_TEXT_FUNCTION = '''
+CREATE OR REPLACE FUNCTION fyyur_genres_text(varchar[]) RETURNS text AS $$
+    SELECT array_to_string($1, ' ')
+$$ LANGUAGE sql IMMUTABLE'''
+
+SEARCH_INDEXES = [
+    'CREATE INDEX IF NOT EXISTS "ix_{table}_name_trgm" ON "{table}" USING gin (name gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS "ix_{table}_city_trgm" ON "{table}" USING gin (city gin_trgm_ops)',
+    'CREATE INDEX IF NOT EXISTS "ix_{table}_genres_trgm" ON "{table}" USING gin (fyyur_genres_text(genres) gin_trgm_ops)',
+]
+
+
+def install_search_ddl(metadata, tables):
+    # Creates the trigram indexes alongside the tables on db.create_all().
+    # Existing databases get them from the matching migration.
+    event.listen(metadata, 'before_create', DDL(
+        'CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(dialect='postgresql'))
+    event.listen(metadata, 'before_create', DDL(
+        GENRES_TEXT_FUNCTION).execute_if(dialect='postgresql'))
+    for table in tables:
+        for index in SEARCH_INDEXES:
+            event.listen(table, 'after_create', DDL(
+                index.format(table=table.name)).execute_if(dialect='postgresql'))
+
+
+def escape_like(term):
+    return (term.replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+def search_backend_for(session):
+    if session.get_bind().dialect.name == 'postgresql':
+        return PostgresSearchBackend(session)
+    return LikeSearchBackend(session)
+
+
+class SearchBackend:
+    def search(self, model, term, after=None, before=None, page_size=PAGE_SIZE):
+        """Returns {"count": total number of matches, "data": one page of
+        matches, best first, "next_cursor", "prev_cursor"} for the Venue or
+        Artist model"""
+        raise NotImplementedError()
+
+    def results(self, page, count):
+        return {
+            "count": count,
+            "data": page.items,
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor
+        }
+
+
+class SQLSearchBackend(SearchBackend):
+    def __init__(self, session):
+        self.session = session
+
+    def matches(self, model, term):
+        """Returns the matching rows as a subquery with the total count of
+        matches and a sort_rank column, lower is better"""
+        raise NotImplementedError()
+
+    def search(self, model, term, after=None, before=None, page_size=PAGE_SIZE):
+        matches = self.matches(model, term)
+        # The window count is taken before the page is sliced off, so it
+        # is the total number of matches
+        keys = [matches.c.sort_rank, matches.c.name, matches.c.id]
+        page = keyset_page(self.session.query(matches), keys,
+                           after, before, page_size)
+        return self.results(page, page.items[0].total if page.items else 0)
+
+    def columns(self, model):
+        return [
+            model.id,
+            model.name,
+            model.city,
+            model.state,
+            model.upcoming_shows_count.label('num_upcoming_shows'),
+            func.count().over().label('total'),
+        ]
+
+
+class PostgresSearchBackend(SQLSearchBackend):
+    def matches(self, model, term):
+        pattern = '%{}%'.format(escape_like(term))
+        genres = func.fyyur_genres_text(model.genres)
+        rank = func.greatest(
+            func.word_similarity(term, model.name),
+            func.word_similarity(term, model.city) * 0.5,
+            func.word_similarity(term, genres) * 0.5)
+
+        return (self.session.query(
+            *self.columns(model),
+            (-rank).label('sort_rank'))
+            .filter(or_(
+                model.name.ilike(pattern, escape='\\'),
+                model.city.ilike(pattern, escape='\\'),
+                genres.ilike(pattern, escape='\\')))
+            .subquery())
+
+
+class LikeSearchBackend(SQLSearchBackend):
+    def matches(self, model, term):
+        lowered = escape_like(term.lower())
+        name = func.lower(model.name)
+        city = func.lower(model.city)
+        # Name prefix matches first, then other name matches, then city matches
+        rank = case([
+            (name.like(lowered + '%', escape='\\'), 0),
+            (name.like('%' + lowered + '%', escape='\\'), 1),
+        ], else_=2)
+
+        return (self.session.query(
+            *self.columns(model),
+            rank.label('sort_rank'))
+            .filter(or_(
+                name.like('%' + lowered + '%', escape='\\'),
+                city.like('%' + lowered + '%', escape='\\')))
+            .subquery())
+
+
+class SearchRecord(dict):
+    # Lets templates use record.name as they would on a query row
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class InMemorySearchBackend(SearchBackend):
+    def __init__(self, records):
+        # records maps a table name ('Venue', 'Artist') to a list of dicts
+        # with id, name, city, state, genres and num_upcoming_shows
+        self.records = {
+            table: [SearchRecord(record) for record in table_records]
+            for table, table_records in records.items()
+        }
+
+    def rank(self, record, term):
+        name = (record['name'] or '').lower()
+        if name.startswith(term):
+            return 0
+        if term in name:
+            return 1
+        if term in (record['city'] or '').lower():
+            return 2
+        if any(term in genre.lower() for genre in record.get('genres') or []):
+            return 3
+        return None
+
+    def search(self, model, term, after=None, before=None, page_size=PAGE_SIZE):
+        term = term.lower()
+        matches = []
+        for record in self.records.get(model.__tablename__, []):
+            rank = self.rank(record, term)
+            if rank is not None:
+                record = SearchRecord(record, sort_rank=rank)
+                matches.append(record)
+
+        def sort_key(record):
+            return [record['sort_rank'], record['name'], record['id']]
+
+        matches.sort(key=sort_key)
+        page = keyset_slice(matches, sort_key, after, before, page_size)
+        return self.results(page, len(matches))
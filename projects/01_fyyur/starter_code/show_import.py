@@ -0,0 +1,272 @@
+#----------------------------------------------------------------------------#
+# Bulk show import.
+#
+# Reads shows from a CSV file (with a venue_id,artist_id,start_time header)
+# or from NDJSON (one {"venue_id": ..., "artist_id": ..., "start_time": ...}
+# object per line) without loading the whole feed, and inserts them batch by
+# batch: each batch is validated, written with one multi-row INSERT and
+# committed on its own, so a bad batch doesn't lose the others.
+#
+# Venue and artist ids are checked against sets of the known ids, loaded
+# once per import. Ids missing from the sets are looked up in one query per
+# batch, to pick up venues and artists created during the import.
+#
+# Rows that can't be imported are reported with their line number. A feed
+# that can't be read any further (malformed CSV, text that isn't UTF-8)
+# stops the import with a FeedError, reported the same way; the batches
+# read before it are still imported.
+#----------------------------------------------------------------------------#
+
+import csv
+import json
+import time
+from datetime import datetime, timezone
+
+import dateutil.parser
+from sqlalchemy.exc import SQLAlchemyError
+
+BATCH_SIZE = 1000
+# Rows kept in ImportReport.errors, later errors are only counted
+MAX_REPORTED_ERRORS = 1000
+
+FIELDS = ('venue_id', 'artist_id', 'start_time')
+
+
+class RowError(ValueError):
+    pass
+
+
+class FeedError(ValueError):
+    """The feed can't be read past line_number"""
+
+    def __init__(self, line_number, message):
+        super().__init__(message)
+        self.line_number = line_number
+
+
+def decode_lines(lines, encoding='utf-8'):
+    """Decodes the lines of a binary feed one at a time, so text that can't
+    be decoded is reported on its own line"""
+    for line_number, line in enumerate(lines, 1):
+        try:
+            yield line.decode(encoding)
+        except UnicodeDecodeError as error:
+            raise FeedError(line_number, 'invalid {} text: {}'.format(encoding, error.reason))
+
+
+def csv_records(lines):
+    """Yields (line number, row dict) for each row of a CSV feed"""
+    reader = csv.DictReader(lines)
+    while True:
+        # A stray quote makes the reader swallow the following lines into
+        # one field, the error is reported where that row starts
+        line_number = reader.line_num + 1
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            raise FeedError(line_number, 'malformed CSV: {}'.format(error))
+        yield reader.line_num, row
+
+
+def ndjson_records(lines):
+    """Yields (line number, row dict) for each line of an NDJSON feed, or
+    (line number, RowError) for lines that aren't JSON objects"""
+    for line_number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, RowError('invalid JSON: {}'.format(error))
+            continue
+        if not isinstance(row, dict):
+            yield line_number, RowError('expected a JSON object')
+            continue
+        yield line_number, row
+
+
+READERS = {
+    'csv': csv_records,
+    'ndjson': ndjson_records,
+}
+
+
+def feed_format(name):
+    """Guesses the format of a feed from its file name or content type"""
+    name = (name or '').lower()
+    if name.endswith(('.ndjson', '.jsonl', 'ndjson', 'json')):
+        return 'ndjson'
+    return 'csv'
+
+
+def parse_start_time(value):
+    """Parses a start time, times with an offset become naive UTC like the
+    rest of the database"""
+    if not isinstance(value, datetime):
+        try:
+            value = datetime.fromisoformat(value)
+        except (TypeError, ValueError):
+            value = dateutil.parser.parse(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def parse_id(value):
+    # int() would truncate 1.5 from an NDJSON feed
+    if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+        raise ValueError(value)
+    return int(value)
+
+
+def parse_row(row):
+    """Returns the venue id, artist id and start time of a feed row"""
+    missing = [field for field in FIELDS if row.get(field) in (None, '')]
+    if missing:
+        raise RowError('missing {}'.format(', '.join(missing)))
+    try:
+        venue_id = parse_id(row['venue_id'])
+        artist_id = parse_id(row['artist_id'])
+    except (TypeError, ValueError):
+        raise RowError('venue_id and artist_id must be integers')
+    try:
+        start_time = parse_start_time(row['start_time'])
+    except (TypeError, ValueError, OverflowError):
+        raise RowError('invalid start_time {!r}'.format(row['start_time']))
+    return venue_id, artist_id, start_time
+
+
+class IdSet:
+    """The ids of a table, loaded on first use"""
+
+    def __init__(self, session, column):
+        self.session = session
+        self.column = column
+        self.ids = None
+
+    def load(self):
+        self.ids = {id for (id,) in self.session.query(self.column)}
+
+    def missing(self, ids):
+        """Returns the ids that don't exist, looking up the ones created
+        since the set was loaded"""
+        if self.ids is None:
+            self.load()
+        unknown = set(ids) - self.ids
+        if unknown:
+            found = {id for (id,) in self.session.query(self.column)
+                     .filter(self.column.in_(unknown))}
+            self.ids |= found
+            unknown -= found
+        return unknown
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.imported = 0
+        self.batches = 0
+        self.error_count = 0
+        self.errors = []
+        # Set when the import stopped on a FeedError
+        self.feed_error = False
+        self.seconds = 0.0
+
+    def error(self, line_number, message):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line_number, 'error': str(message)})
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.seconds if self.seconds else 0.0
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'imported': self.imported,
+            'batches': self.batches,
+            'error_count': self.error_count,
+            'errors': self.errors,
+            'seconds': round(self.seconds, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+class ShowImporter:
+    """Imports shows into show_table. venue_ids and artist_ids are the IdSets
+    of the venues and artists. before_insert(shows) is called with each batch
+    of show dicts, in the transaction that inserts them."""
+
+    def __init__(self, session, show_table, venue_ids, artist_ids,
+                 before_insert=None, batch_size=BATCH_SIZE):
+        self.session = session
+        self.show_table = show_table
+        self.venue_ids = venue_ids
+        self.artist_ids = artist_ids
+        self.before_insert = before_insert
+        self.batch_size = batch_size
+
+    def run(self, records):
+        """Imports the (line number, row) records of csv_records() or
+        ndjson_records() and returns an ImportReport"""
+        report = ImportReport()
+        started = time.perf_counter()
+        batch = []
+        try:
+            for line_number, row in records:
+                report.rows += 1
+                if isinstance(row, Exception):
+                    report.error(line_number, row)
+                    continue
+                batch.append((line_number, row))
+                if len(batch) >= self.batch_size:
+                    self.import_batch(batch, report)
+                    batch = []
+        except FeedError as error:
+            report.error(error.line_number, error)
+            report.feed_error = True
+        if batch:
+            self.import_batch(batch, report)
+        report.seconds = time.perf_counter() - started
+        return report
+
+    def import_batch(self, batch, report):
+        parsed = []
+        errors = []
+        for line_number, row in batch:
+            try:
+                parsed.append((line_number,) + parse_row(row))
+            except RowError as error:
+                errors.append((line_number, error))
+
+        missing_venues = self.venue_ids.missing(row[1] for row in parsed)
+        missing_artists = self.artist_ids.missing(row[2] for row in parsed)
+        shows = []
+        for line_number, venue_id, artist_id, start_time in parsed:
+            if venue_id in missing_venues:
+                errors.append((line_number, 'unknown venue_id {}'.format(venue_id)))
+            elif artist_id in missing_artists:
+                errors.append((line_number, 'unknown artist_id {}'.format(artist_id)))
+            else:
+                shows.append({'Venue_id': venue_id, 'Artist_id': artist_id,
+                              'start_time': start_time})
+        for line_number, error in sorted(errors, key=lambda error: error[0]):
+            report.error(line_number, error)
+        if not shows:
+            return
+
+        try:
+            if self.before_insert:
+                self.before_insert(shows)
+            self.session.execute(self.show_table.insert().values(shows))
+            self.session.commit()
+        except SQLAlchemyError as error:
+            self.session.rollback()
+            report.error(batch[0][0], 'batch of lines {}-{} failed: {}'.format(
+                batch[0][0], batch[-1][0], error))
+            return
+        report.imported += len(shows)
+        report.batches += 1
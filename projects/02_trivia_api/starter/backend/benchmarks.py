@@ -0,0 +1,171 @@
+'''
+Benchmarks for the trivia backend, run against a throwaway SQLite database:
+
+    python benchmarks.py quiz
+    python benchmarks.py pool
+
+The pool benchmark runs against DATABASE_URL instead when it is set.
+'''
+import os
+import sys
+import tempfile
+import threading
+import time
+from statistics import median
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine.url import make_url
+
+from db_engine import TimedQueuePool, engine_options
+from flaskr import create_app
+from models import db, Question, Category, question_counter, question_id_index
+
+BANK_SIZES = [1000, 10000, 100000, 1000000]
+QUIZ_STEPS = 100
+INSERT_CHUNK = 50000
+POOL_SIZES = [2, 5, 10]
+POOL_THREADS = [1, 5, 10, 20, 40]
+POOL_SECONDS = 2
+
+
+def create_bank(app, size):
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        for category in ['Science', 'Art', 'Geography', 'History', 'Entertainment', 'Sports']:
+            db.session.add(Category(category))
+        for start in range(0, size, INSERT_CHUNK):
+            db.session.execute(Question.__table__.insert(), [{
+                'question': 'Question {}?'.format(i),
+                'answer': 'Answer {}'.format(i),
+                'category': str(i % 6 + 1),
+                'difficulty': i % 5 + 1
+            } for i in range(start, min(start + INSERT_CHUNK, size))])
+        db.session.commit()
+        question_counter.invalidate()
+        question_id_index.invalidate()
+
+
+def benchmark_quiz():
+    '''
+    per-step latency of POST /quizzes, for a whole quiz of QUIZ_STEPS steps
+    in one category, as the question bank grows
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({
+            'database_path': 'sqlite:///' + os.path.join(directory, 'benchmark.db')
+        })
+        client = app.test_client()
+        print('{:>10} {:>14} {:>14}'.format('questions', 'median (ms)', 'max (ms)'))
+
+        for size in BANK_SIZES:
+            create_bank(app, size)
+            # The first step builds the id index
+            client.post('/quizzes', json={'previous_questions': [],
+                                          'quiz_category': {'type': 'Science', 'id': 1}})
+
+            previous_questions = []
+            timings = []
+            for _ in range(QUIZ_STEPS):
+                started = time.perf_counter()
+                res = client.post('/quizzes', json={
+                    'previous_questions': previous_questions,
+                    'quiz_category': {'type': 'Science', 'id': 1}
+                })
+                timings.append(time.perf_counter() - started)
+                previous_questions.append(res.get_json()['question']['id'])
+
+            print('{:>10} {:>14.3f} {:>14.3f}'.format(
+                size, median(timings) * 1000, max(timings) * 1000))
+
+
+def load_test(engine, threads, duration, hold=0.01, think=0.01):
+    '''Runs <threads> threads for <duration> seconds, each repeatedly
+    checking out a connection, running a query and holding the connection
+    for <hold> seconds, then working <think> seconds without it, as a
+    request would. Returns the queries per second and the checkout wait
+    times in milliseconds.'''
+    deadline = time.monotonic() + duration
+    waits = []
+    errors = []
+    lock = threading.Lock()
+
+    def run():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    waited = time.perf_counter() - started
+                    connection.execute('SELECT 1')
+                    time.sleep(hold)
+            except Exception as error:
+                with lock:
+                    errors.append(error)
+                continue
+            with lock:
+                waits.append(waited)
+            time.sleep(think)
+
+    workers = [threading.Thread(target=run) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    waits.sort()
+
+    def percentile(fraction):
+        return waits[min(int(len(waits) * fraction), len(waits) - 1)] * 1000 if waits else 0.0
+
+    return {
+        'queries_per_second': len(waits) / duration,
+        'wait_ms_p50': percentile(0.5),
+        'wait_ms_p99': percentile(0.99),
+        'wait_ms_max': waits[-1] * 1000 if waits else 0.0,
+        'errors': len(errors),
+    }
+
+
+def pool_engine(url, size):
+    if make_url(url).get_backend_name() == 'sqlite':
+        options = {
+            'poolclass': TimedQueuePool,
+            'pool_size': size,
+            'max_overflow': 0,
+            'connect_args': {'check_same_thread': False}
+        }
+    else:
+        options = engine_options(url, {'DB_POOL_SIZE': str(size), 'DB_MAX_OVERFLOW': '0'})
+    return create_engine(url, **options)
+
+
+def benchmark_pool():
+    '''
+    throughput and checkout wait times as more threads than the pool has
+    connections share it, each holding its connection for 10ms per query
+    and working 10ms between queries
+    '''
+    with tempfile.TemporaryDirectory() as directory:
+        url = os.environ.get('DATABASE_URL') or 'sqlite:///' + os.path.join(directory, 'benchmark.db')
+        print('{:>6} {:>8} {:>10} {:>14} {:>14} {:>14}'.format(
+            'pool', 'threads', 'queries/s', 'wait p50 (ms)', 'wait p99 (ms)', 'wait max (ms)'))
+
+        for size in POOL_SIZES:
+            for threads in POOL_THREADS:
+                engine = pool_engine(url, size)
+                result = load_test(engine, threads, POOL_SECONDS)
+                engine.dispose()
+                print('{:>6} {:>8} {:>10.0f} {:>14.3f} {:>14.3f} {:>14.3f}'.format(
+                    size, threads, result['queries_per_second'], result['wait_ms_p50'],
+                    result['wait_ms_p99'], result['wait_ms_max']))
+
+
+BENCHMARKS = {
+    'quiz': benchmark_quiz,
+    'pool': benchmark_pool,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print('# {}'.format(name))
+        BENCHMARKS[name]()
@@ -0,0 +1,117 @@
+#----------------------------------------------------------------------------#
+# Database engine configuration.
+#
+# Pool sizing and timeouts come from the environment, so they can follow the
+# number of workers per deployment:
+#
+#   DB_POOL_SIZE          connections kept open per process (10)
+#   DB_MAX_OVERFLOW       extra connections opened under load (20)
+#   DB_POOL_TIMEOUT       seconds to wait for a free connection (30)
+#   DB_POOL_RECYCLE       seconds before a connection is replaced (1800)
+#   DB_STATEMENT_TIMEOUT  milliseconds before Postgres cancels a statement
+#                         (30000, 0 for none)
+#
+# Connections are pinged when checked out, so the ones left broken by a
+# database failover or restart are replaced instead of failing a request.
+# TimedQueuePool records how long checkouts waited for a free connection;
+# pool_stats() reports it with the pool's counters for /debug/pool.
+#
+# Fyyur and the Trivia API share no package, so each ships this file
+# (01_fyyur/starter_code/db_engine.py, 02_trivia_api/starter/backend/
+# db_engine.py). The copies must stay identical; Fyyur's test_app.py fails
+# when they drift.
+#----------------------------------------------------------------------------#
+
+import os
+import threading
+import time
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+
+def env_number(environ, name, default, cast=int):
+    value = environ.get(name)
+    return cast(value) if value not in (None, '') else default
+
+
+class TimedQueuePool(QueuePool):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.wait_lock = threading.Lock()
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    def _do_get(self):
+        # No idle connection and no room to open another one
+        exhausted = (self._pool.empty() and self._max_overflow > -1
+                     and self._overflow >= self._max_overflow)
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except Exception:
+            with self.wait_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self.wait_lock:
+                self.checkouts += 1
+                self.waits += exhausted
+                self.wait_seconds += waited
+                self.max_wait_seconds = max(self.max_wait_seconds, waited)
+
+
+def engine_options(url, environ=os.environ):
+    """Returns the SQLALCHEMY_ENGINE_OPTIONS for the database at url"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # Flask-SQLAlchemy picks the pool for SQLite files and memory
+        return {'pool_pre_ping': True}
+
+    options = {
+        'poolclass': TimedQueuePool,
+        'pool_size': env_number(environ, 'DB_POOL_SIZE', 10),
+        'max_overflow': env_number(environ, 'DB_MAX_OVERFLOW', 20),
+        'pool_timeout': env_number(environ, 'DB_POOL_TIMEOUT', 30, float),
+        'pool_recycle': env_number(environ, 'DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+    }
+    statement_timeout = env_number(environ, 'DB_STATEMENT_TIMEOUT', 30000)
+    # postgres:// is the older spelling of postgresql://
+    if url.get_backend_name() in ('postgresql', 'postgres') and statement_timeout:
+        options['connect_args'] = {
+            'options': '-c statement_timeout={:d}'.format(statement_timeout)
+        }
+    return options
+
+
+def pool_stats(engine):
+    """Returns the pool's counters, and the checkout wait times when the
+    pool is a TimedQueuePool"""
+    pool = engine.pool
+    stats = {'pool': type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            # Negative until the pool has opened pool_size connections
+            'overflow': pool.overflow(),
+            'max_overflow': pool._max_overflow,
+        })
+    if isinstance(pool, TimedQueuePool):
+        with pool.wait_lock:
+            stats.update({
+                'checkouts': pool.checkouts,
+                'waits': pool.waits,
+                'timeouts': pool.timeouts,
+                'wait_ms_total': round(pool.wait_seconds * 1000, 3),
+                'wait_ms_avg': round(pool.wait_seconds * 1000 / pool.checkouts, 3)
+                if pool.checkouts else 0.0,
+                'wait_ms_max': round(pool.max_wait_seconds * 1000, 3),
+            })
+    return stats
@@ -2,9 +2,12 @@ import os
 from flask import Flask, request, abort, jsonify
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
-import random
 
-from models import setup_db, Question, Category
+from models import setup_db, db, Question, Category, question_counter, question_id_index, category_cache
+from question_search import question_search_for
+from db_engine import pool_stats
+from query_profiler import QueryProfiler
+from .quiz_sessions import QuizSession, InMemoryQuizSessionStore
 
 QUESTIONS_PER_PAGE = 10
 
@@ -12,8 +15,15 @@ QUESTIONS_PER_PAGE = 10
 def create_app(test_config=None):
     # create and configure the app
     app = Flask(__name__)
-    setup_db(app)
+    if test_config and 'database_path' in test_config:
+        setup_db(app, test_config['database_path'])
+    else:
+        setup_db(app)
     CORS(app, resources={r"/api/*": {"origins": "*"}})
+    # Query count and database time per request, see query_profiler.py
+    QueryProfiler(app)
+    quiz_sessions = (test_config or {}).get(
+        'quiz_session_store') or InMemoryQuizSessionStore()
 
     '''
   @TODO: Set up CORS. Allow '*' for origins. Delete the sample route after completing the TODOs
@@ -34,15 +44,18 @@ def create_app(test_config=None):
 # Custom Built Functions
 #----------------------------------------------------------------------------#
 
-    def pagination(request, selection):
+    def pagination(request, query):
+        # Only the requested page is fetched and formatted
         page = request.args.get('page', 1, type=int)
-        start = (page - 1) * QUESTIONS_PER_PAGE
-        end = start + QUESTIONS_PER_PAGE
+        if page < 1:
+            return []
 
-        questions = [question.format() for question in selection]
-        current_questions = questions[start:end]
+        questions = (query.order_by(Question.id)
+                     .limit(QUESTIONS_PER_PAGE)
+                     .offset((page - 1) * QUESTIONS_PER_PAGE)
+                     .all())
 
-        return current_questions
+        return [question.format() for question in questions]
 
     def customErrorMessages(error, default_message):
         try:
@@ -58,23 +71,20 @@ def create_app(test_config=None):
     @app.route('/categories', methods=['GET'])
     def get_all_categories():
 
-        categories = Category.query.all()
+        returned_categories = category_cache.types()
 
-        if not categories:
+        if not returned_categories:
 
             abort(404)
 
-        all_categories = [category.format() for category in categories]
-
-        returned_categories = []
-        for index in all_categories:
-            returned_categories.append(index['type'])
-
-        return jsonify({
+        # Clients sending the ETag back in If-None-Match get a 304
+        response = jsonify({
             "success": True,
             "status code": 200,
             "categories": returned_categories
         })
+        response.set_etag(category_cache.current_etag())
+        return response.make_conditional(request)
 
     '''
   @TODO:
@@ -91,20 +101,14 @@ def create_app(test_config=None):
     @app.route('/questions', methods=['GET'])
     def get_questions():
 
-        selection = Question.query.order_by(Question.id).all()
-        paginated_questions = pagination(request, selection)
+        paginated_questions = pagination(request, Question.query)
         if len(paginated_questions) == 0:
             abort(404)
-        categories = Category.query.all()
-        all_categories = [category.format() for category in categories]
-
-        returned_categories = []
-        for cat in all_categories:
-            returned_categories.append(cat['type'])
+        returned_categories = category_cache.types()
         return jsonify({
             "success": True,
             "questions": paginated_questions,
-            "total_questions": len(selection),
+            "total_questions": question_counter.count(),
             "categories": returned_categories,
             "current_category": returned_categories
         })
@@ -172,15 +176,14 @@ def create_app(test_config=None):
             )
             question.insert()
 
-            selections = Question.query.order_by(Question.id).all()
-            questions_paginated = pagination(request, selections)
+            questions_paginated = pagination(request, Question.query)
 
             return jsonify(
                 {
                     "success": True,
                     'created': question.id,
                     "questions": questions_paginated,
-                    "total_questions": len(selections)
+                    "total_questions": question_counter.count()
                 }
             )
         except:
@@ -198,28 +201,32 @@ def create_app(test_config=None):
     @ app.route('/questions/search', methods=['POST'])
     def search_questions():
         body = request.get_json()
+        if not body:
+            abort(400, {'message': 'request does not contain a valid JSON body.'})
 
-        search_term = body.get('searchTerm', None)
-
-        if search_term:
-            questions = Question.query.filter(
-                Question.question.contains(search_term)).all()
-            if not questions:
-                abort(
-                    404, {'message': 'questions that contains "{}" not found.'.format(search_term)})
+        search_term = (body.get('searchTerm') or '').strip()
+        if not search_term:
+            abort(400, {'message': 'searchTerm can not be blank'})
 
-            question_found = [question.format() for question in questions]
-            selections = Question.query.order_by(Question.id).all()
+        # Matches on the question or the answer, best match first, one page
+        # at a time
+        page = request.args.get('page', 1, type=int)
+        if page < 1:
+            abort(404, {'message': 'No questions in the sslected page.'})
 
-            categories = Category.query.all()
-            all_categories = [category.format() for category in categories]
+        questions, matching_questions = question_search_for(
+            db.session, Question).search(search_term, page, QUESTIONS_PER_PAGE)
+        if not questions:
+            abort(
+                404, {'message': 'questions that contains "{}" not found.'.format(search_term)})
 
-            return jsonify({
-                "success": True,
-                "questions": question_found,
-                "total_questions": len(selections),
-                "current_category": all_categories
-            })
+        return jsonify({
+            "success": True,
+            "questions": [question.format() for question in questions],
+            "matching_questions": matching_questions,
+            "total_questions": question_counter.count(),
+            "current_category": category_cache.get()
+        })
 
     '''
   @TODO:
@@ -232,14 +239,14 @@ def create_app(test_config=None):
     @ app.route('/categories/<int:category_id>/questions', methods=['GET'])
     def get_questions_by_categories(category_id):
 
-        selection = (Question.query.filter(Question.category == str(
-            category_id)).order_by(Question.id).all())
+        total_questions = question_counter.count(category_id)
 
-        if not selection:
+        if not total_questions:
             abort(
                 404, {'message': 'No questions with category {} found.'.format(category_id)})
 
-        questions_paginated = pagination(request, selection)
+        questions_paginated = pagination(request, Question.query.filter(
+            Question.category == str(category_id)))
 
         if not questions_paginated:
             abort(404, {'message': 'No questions in the sslected page.'})
@@ -247,7 +254,7 @@ def create_app(test_config=None):
         return jsonify({
             "success": True,
             "questions": questions_paginated,
-            "total_questions": len(selection),
+            "total_questions": total_questions,
             "current_category": category_id
         })
 
@@ -269,32 +276,101 @@ def create_app(test_config=None):
             abort(400, {
                   'message': 'Please provide a JSON body with previous question Id\'s and optional category.'})
 
-        previous_questions = body.get('previous_questions', None)
+        previous_questions = body.get('previous_questions', None) or []
         current_category = body.get('quiz_category', None)
 
-        if not previous_questions:
-            if current_category:
-                raw_questions = Question.query.filter(
-                    Question.category == str(current_category['id'])).all()
-            else:
-                raw_questions = Question.query.all()
-        else:
-            if current_category:
-                raw_questions = (Question.query.filter(Question.category == str(current_category['id']))
-                                 .filter(Question.id.notin_(previous_questions))
-                                 .all())
+        # A random id is drawn from the in-memory index and only that
+        # question is fetched. A category id of 0 stands for all categories.
+        category_id = None
+        if current_category and current_category.get('id'):
+            category_id = current_category['id']
+
+        question_id = question_id_index.random_id(
+            category_id, exclude=previous_questions)
+        random_question = None
+        if question_id is not None:
+            question = Question.query.get(question_id)
+            if question:
+                random_question = question.format()
             else:
-                raw_questions = (Question.query.filter(Question.id.notin_(previous_questions))
-                                 .all())
-        formatted_questions = [question.format() for question in raw_questions]
-        random_question = formatted_questions[random.randint(
-            0, len(formatted_questions))]
+                # Deleted by another worker since the index was built
+                question_id_index.invalidate()
 
         return jsonify({
             "success": True,
             "question": random_question
         })
 
+    '''
+  Quiz sessions: the server keeps track of the questions already asked,
+  the client only sends the session id to get the next question.
+  '''
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        body = request.get_json(silent=True) or {}
+        current_category = body.get('quiz_category', None)
+
+        category_id = None
+        if current_category and current_category.get('id'):
+            category_id = str(current_category['id'])
+
+        session = QuizSession.start(
+            category_id, question_id_index.size(category_id))
+        quiz_sessions.put(session.session_id, session.to_dict())
+
+        return jsonify({
+            "success": True,
+            "session_id": session.session_id,
+            "total_questions": session.deck_size
+        })
+
+    @app.route('/quizzes/sessions/<session_id>/next', methods=['POST'])
+    def next_quiz_question(session_id):
+        data = quiz_sessions.get(session_id)
+        if data is None:
+            abort(404, {'message': 'Quiz session {} not found.'.format(session_id)})
+
+        session = QuizSession.from_dict(data)
+        asked = set(session.asked)
+        question = None
+        position = session.next_position()
+        while question is None and position is not None:
+            # Positions past the end belong to questions deleted since the
+            # session started, and deletes may move an asked id to a later
+            # position
+            question_id = question_id_index.id_at(session.category, position)
+            if question_id is not None and question_id not in asked:
+                question = Question.query.get(question_id)
+            position = session.next_position()
+        while question is None:
+            # Questions the permutation missed, drawn at random
+            question_id = question_id_index.random_id(session.category, exclude=asked)
+            if question_id is None:
+                break
+            question = Question.query.get(question_id)
+            if question is None:
+                # Deleted by another worker since the index was built
+                asked.add(question_id)
+                question_id_index.invalidate()
+
+        random_question = None
+        if question is not None:
+            session.asked.append(question.id)
+            random_question = question.format()
+        quiz_sessions.put(session_id, session.to_dict())
+
+        return jsonify({
+            "success": True,
+            "question": random_question
+        })
+
+    # Pool internals are only exposed in debug mode, or with DEBUG_POOL=1
+    if app.debug or (test_config or {}).get('debug_pool') or os.environ.get('DEBUG_POOL') == '1':
+        @app.route('/debug/pool', methods=['GET'])
+        def debug_pool():
+            # Connection pool counters and checkout wait times, see db_engine.py
+            return jsonify(pool_stats(db.engine))
+
 
         '''
   @TODO:
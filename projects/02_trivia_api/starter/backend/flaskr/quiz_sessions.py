@@ -0,0 +1,132 @@
+import random
+import secrets
+import time
+from collections import OrderedDict
+from math import gcd
+from threading import Lock
+
+'''
+Quiz sessions
+    keep the state of a quiz on the server so that clients only send a
+    session id to get the next question, instead of the growing list of
+    previous questions.
+
+    A session walks the category's ids (see models.QuestionIdIndex) in a
+    random order without storing a shuffled deck: the order is the
+    permutation position -> (multiplier * position + offset) % deck_size,
+    which visits every position once when multiplier and deck_size are
+    coprime.
+
+    Positions are only a way to draw the next question: the index moves
+    ids around on deletes and reloads, and every worker has its own copy.
+    The session therefore also keeps the ids it has asked, skips them when
+    a position points at one again, and once the permutation is exhausted
+    draws the questions it missed at random. Every question is asked once,
+    including the ones added to the category during the quiz.
+'''
+
+
+class QuizSession:
+    def __init__(self, session_id, category, deck_size, multiplier, offset, step=0,
+                 asked=None):
+        self.session_id = session_id
+        self.category = category
+        self.deck_size = deck_size
+        self.multiplier = multiplier
+        self.offset = offset
+        self.step = step
+        self.asked = list(asked or [])
+
+    @classmethod
+    def start(cls, category, deck_size):
+        multiplier = 1
+        if deck_size > 1:
+            multiplier = random.randrange(1, deck_size)
+            while gcd(multiplier, deck_size) != 1:
+                multiplier = random.randrange(1, deck_size)
+        return cls(secrets.token_urlsafe(16), category, deck_size,
+                   multiplier, random.randrange(max(deck_size, 1)))
+
+    def next_position(self):
+        '''
+        returns the next position in the deck, or None once every question
+        has been drawn
+        '''
+        if self.step >= self.deck_size:
+            return None
+        position = (self.multiplier * self.step + self.offset) % self.deck_size
+        self.step += 1
+        return position
+
+    def to_dict(self):
+        return {
+            'session_id': self.session_id,
+            'category': self.category,
+            'deck_size': self.deck_size,
+            'multiplier': self.multiplier,
+            'offset': self.offset,
+            'step': self.step,
+            'asked': self.asked
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+'''
+QuizSessionStore
+    interface for session storage. Sessions are stored as plain dicts of
+    strings, integers and lists of integers, so a store backed by Redis or
+    any key-value service only has to serialize them.
+'''
+
+
+class QuizSessionStore:
+    def get(self, session_id):
+        raise NotImplementedError()
+
+    def put(self, session_id, data):
+        raise NotImplementedError()
+
+    def delete(self, session_id):
+        raise NotImplementedError()
+
+
+'''
+InMemoryQuizSessionStore
+    per-process LRU store, the default. The least recently used sessions
+    are dropped past max_sessions, and sessions expire after ttl seconds
+    without a question being asked.
+'''
+
+
+class InMemoryQuizSessionStore(QuizSessionStore):
+    def __init__(self, max_sessions=100000, ttl=3600):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.lock = Lock()
+        self.sessions = OrderedDict()
+
+    def get(self, session_id):
+        with self.lock:
+            entry = self.sessions.get(session_id)
+            if entry is None:
+                return None
+            data, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.sessions[session_id]
+                return None
+            self.sessions.move_to_end(session_id)
+            return dict(data)
+
+    def put(self, session_id, data):
+        with self.lock:
+            self.sessions[session_id] = (dict(data), time.monotonic() + self.ttl)
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+
+    def delete(self, session_id):
+        with self.lock:
+            self.sessions.pop(session_id, None)
@@ -1,8 +1,15 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+import hashlib
+import random
+import time
+from array import array
+from threading import Lock
+from sqlalchemy import Column, String, Integer, create_engine, func, event
 from flask_sqlalchemy import SQLAlchemy
 import json
 from config import database_credentials
+from question_search import install_question_search, install_search_ddl
+from db_engine import engine_options
 
 database_name = "trivia"
 database_path = "postgres://{}:{}@{}/{}".format(database_credentials['username'],database_credentials['password'],'localhost:5432', database_name)
@@ -11,14 +18,168 @@ db = SQLAlchemy()
 
 '''
 setup_db(app)
-    binds a flask application and a SQLAlchemy service
+    binds a flask application and a SQLAlchemy service, with the pool sizes
+    and timeouts from db_engine.py, and creates the question search indexes
 '''
 def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_path)
     db.app = app
     db.init_app(app)
     db.create_all()
+    install_question_search(db.engine)
+
+'''
+QuestionCounter
+    caches the number of questions, overall and per category, so the
+    paginated endpoints don't count the table on every request.
+    A single grouped COUNT refreshes every category at once. Question.insert()
+    and Question.delete() keep this worker's copy exact, writes from other
+    workers are picked up once the cached counts are older than ttl seconds.
+'''
+class QuestionCounter:
+  def __init__(self, ttl=30):
+    self.ttl = ttl
+    self.lock = Lock()
+    self.counts = None
+    self.loaded_at = 0
+
+  def count(self, category=None):
+    with self.lock:
+      if self.counts is None or time.monotonic() - self.loaded_at > self.ttl:
+        # trivia.psql stores categories as integers, they're looked up as strings
+        self.counts = {str(category): count for category, count in db.session.query(
+          Question.category, func.count(Question.id)).group_by(Question.category)}
+        self.loaded_at = time.monotonic()
+      if category is None:
+        return sum(self.counts.values())
+      return self.counts.get(str(category), 0)
+
+  def adjust(self, category, delta):
+    with self.lock:
+      if self.counts is not None:
+        category = str(category)
+        self.counts[category] = self.counts.get(category, 0) + delta
+
+  def invalidate(self):
+    with self.lock:
+      self.counts = None
+
+question_counter = QuestionCounter()
+
+'''
+QuestionIdIndex
+    keeps the ids of every question in memory, per category, so a quiz can
+    draw a random question without loading, counting or skipping over rows.
+    Built with a single query on first use, kept exact for this worker by
+    Question.insert() and Question.delete() and rebuilt once older than ttl
+    seconds to pick up writes from other workers.
+
+    Every read and write holds the lock. Each id's position in its arrays is
+    kept in a dict, so a delete moves the last id into the freed slot
+    instead of shifting the array. Positions are therefore not stable
+    across requests; quiz sessions keep the ids they asked instead (see
+    flaskr/quiz_sessions.py).
+'''
+class QuestionIdIndex:
+  # Random draws that hit an already asked question before falling back to
+  # scanning the remaining ids
+  MAX_DRAWS = 16
+
+  def __init__(self, ttl=300):
+    self.ttl = ttl
+    self.lock = Lock()
+    self.by_category = None
+    self.all_ids = None
+    # question id -> position in all_ids, and in its category's array
+    self.positions = None
+    self.category_positions = None
+    self.loaded_at = 0
+
+  def load(self):
+    self.by_category = {}
+    self.all_ids = array('l')
+    self.positions = {}
+    self.category_positions = {}
+    for question_id, category in db.session.query(
+        Question.id, Question.category).order_by(Question.id).yield_per(10000):
+      self.append(category, question_id)
+    self.loaded_at = time.monotonic()
+
+  def current_ids(self, category=None):
+    # Called with the lock held
+    if self.by_category is None or time.monotonic() - self.loaded_at > self.ttl:
+      self.load()
+    if category is None:
+      return self.all_ids
+    return self.by_category.get(str(category), array('l'))
+
+  def size(self, category=None):
+    with self.lock:
+      return len(self.current_ids(category))
+
+  def id_at(self, category, position):
+    '''
+    returns the id at position in the category's ids, or None past the end
+    '''
+    with self.lock:
+      ids = self.current_ids(category)
+      return ids[position] if position < len(ids) else None
+
+  def random_id(self, category=None, exclude=()):
+    '''
+    returns the id of a random question in the category (or any category
+    when None) that is not in exclude, or None once all have been asked
+    '''
+    exclude = set(exclude)
+    with self.lock:
+      ids = self.current_ids(category)
+      if len(ids) > len(exclude):
+        for _ in range(self.MAX_DRAWS):
+          question_id = ids[random.randrange(len(ids))]
+          if question_id not in exclude:
+            return question_id
+
+      remaining = [question_id for question_id in ids if question_id not in exclude]
+    if not remaining:
+      return None
+    return random.choice(remaining)
+
+  def append(self, category, question_id):
+    ids = self.by_category.setdefault(str(category), array('l'))
+    self.category_positions[question_id] = len(ids)
+    ids.append(question_id)
+    self.positions[question_id] = len(self.all_ids)
+    self.all_ids.append(question_id)
+
+  @staticmethod
+  def discard(ids, positions, question_id):
+    position = positions.pop(question_id, None)
+    if position is None:
+      return
+    last = ids.pop()
+    if position < len(ids):
+      ids[position] = last
+      positions[last] = position
+
+  def add(self, category, question_id):
+    with self.lock:
+      if self.by_category is not None and question_id not in self.positions:
+        self.append(category, question_id)
+
+  def remove(self, category, question_id):
+    with self.lock:
+      if self.by_category is not None:
+        self.discard(self.by_category.get(str(category), array('l')),
+                     self.category_positions, question_id)
+        self.discard(self.all_ids, self.positions, question_id)
+
+  def invalidate(self):
+    with self.lock:
+      self.by_category = None
+
+question_id_index = QuestionIdIndex()
 
 '''
 Question
@@ -42,13 +203,20 @@ class Question(db.Model):
   def insert(self):
     db.session.add(self)
     db.session.commit()
+    question_counter.adjust(self.category, 1)
+    question_id_index.add(self.category, self.id)
   
   def update(self):
     db.session.commit()
+    question_counter.invalidate()
+    question_id_index.invalidate()
 
   def delete(self):
+    question_id = self.id
     db.session.delete(self)
     db.session.commit()
+    question_counter.adjust(self.category, -1)
+    question_id_index.remove(self.category, question_id)
 
   def format(self):
     return {
@@ -59,6 +227,8 @@ class Question(db.Model):
       'difficulty': self.difficulty
     }
 
+install_search_ddl(Question.__table__)
+
 '''
 Category
 
@@ -76,4 +246,77 @@ class Category(db.Model):
     return {
       'id': self.id,
       'type': self.type
-    }
\ No newline at end of file
+    }
+
+'''
+CategoryCache
+    memoizes the category list and the id -> type map, which almost never
+    change. Any insert, update or delete of a Category through the ORM
+    invalidates it, and it is reloaded once older than ttl seconds to pick up
+    writes from other workers. The etag is a hash of the content, so it is
+    the same on every worker.
+'''
+class CategoryCache:
+  def __init__(self, ttl=300):
+    self.ttl = ttl
+    self.lock = Lock()
+    self.categories = None
+    self.types_by_id = None
+    self.etag = None
+    self.loaded_at = 0
+    self.hits = 0
+    self.misses = 0
+
+  def load(self):
+    self.categories = [category.format() for category in
+                       Category.query.order_by(Category.id).all()]
+    self.types_by_id = {category['id']: category['type'] for category in self.categories}
+    self.etag = hashlib.sha1(json.dumps(
+      self.categories, sort_keys=True).encode()).hexdigest()
+    self.loaded_at = time.monotonic()
+
+  def refresh(self):
+    # Called with the lock held, loads the categories when missing or stale
+    # and counts the load as a miss. Returns whether they were loaded.
+    if self.categories is None or time.monotonic() - self.loaded_at > self.ttl:
+      self.misses += 1
+      self.load()
+      return True
+    return False
+
+  def get(self):
+    '''
+    returns the formatted categories, in id order
+    '''
+    with self.lock:
+      if not self.refresh():
+        self.hits += 1
+      return self.categories
+
+  def types(self):
+    return [category['type'] for category in self.get()]
+
+  def type_of(self, category_id):
+    self.get()
+    return self.types_by_id.get(int(category_id))
+
+  def current_etag(self):
+    # Not counted as a hit, the request reading the categories already was
+    with self.lock:
+      self.refresh()
+      return self.etag
+
+  def stats(self):
+    return {
+      'hits': self.hits,
+      'misses': self.misses
+    }
+
+  def invalidate(self, *args):
+    with self.lock:
+      self.categories = None
+
+category_cache = CategoryCache()
+
+for category_event in ('after_insert', 'after_update', 'after_delete'):
+  event.listen(Category, category_event, category_cache.invalidate)
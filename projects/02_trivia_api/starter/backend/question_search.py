@@ -0,0 +1,166 @@
+from sqlalchemy import DDL, Float, Integer, event, func, or_, text
+
+'''
+Question search
+    case-insensitive substring search over the question and answer text,
+    ranked by relevance, one page at a time. The number of matches comes
+    back with the page in the same query.
+
+    PostgresQuestionSearch  ILIKE served by pg_trgm GIN indexes, ranked by
+                            trigram word similarity
+    SQLiteQuestionSearch    FTS5 table with the trigram tokenizer, kept in
+                            sync by triggers, ranked by bm25. For local
+                            testing.
+    LikeQuestionSearch      unindexed LIKE, for other databases and for
+                            terms shorter than a trigram
+'''
+
+# Search objects by name, with the DDL creating them and the catalog query
+# listing the ones that exist
+POSTGRES_SEARCH_DDL = {
+    'pg_trgm': 'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'ix_questions_question_trgm': 'CREATE INDEX IF NOT EXISTS ix_questions_question_trgm ON questions USING gin (question gin_trgm_ops)',
+    'ix_questions_answer_trgm': 'CREATE INDEX IF NOT EXISTS ix_questions_answer_trgm ON questions USING gin (answer gin_trgm_ops)',
+}
+POSTGRES_SEARCH_OBJECTS = '''
+    SELECT extname FROM pg_extension WHERE extname = 'pg_trgm'
+    UNION ALL
+    SELECT indexname FROM pg_indexes
+    WHERE schemaname = current_schema() AND tablename = 'questions'
+'''
+
+SQLITE_SEARCH_DDL = {
+    'questions_fts': '''CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+        question, answer, content='questions', content_rowid='id', tokenize='trigram')''',
+    'questions_fts_insert': '''CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN
+        INSERT INTO questions_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+    END''',
+    'questions_fts_delete': '''CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+        INSERT INTO questions_fts(questions_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+    END''',
+    'questions_fts_update': '''CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE ON questions BEGIN
+        INSERT INTO questions_fts(questions_fts, rowid, question, answer) VALUES ('delete', old.id, old.question, old.answer);
+        INSERT INTO questions_fts(rowid, question, answer) VALUES (new.id, new.question, new.answer);
+    END''',
+}
+SQLITE_SEARCH_OBJECTS = "SELECT name FROM sqlite_master WHERE name LIKE 'questions_fts%'"
+
+SEARCH_SETUP = {
+    'postgresql': (POSTGRES_SEARCH_DDL, POSTGRES_SEARCH_OBJECTS),
+    'sqlite': (SQLITE_SEARCH_DDL, SQLITE_SEARCH_OBJECTS),
+}
+
+def install_question_search(engine):
+    '''
+    creates the search indexes if they are missing. Safe to run on every
+    start, including against a database restored from trivia.psql.
+
+    The catalog is read first and only the missing objects are created, so
+    once they exist the server starts without issuing any DDL, and can run
+    as a user that isn't allowed to create the pg_trgm extension.
+    '''
+    if engine.dialect.name not in SEARCH_SETUP:
+        return
+    ddl, objects = SEARCH_SETUP[engine.dialect.name]
+    with engine.begin() as connection:
+        existing = {name for (name,) in connection.execute(objects)}
+        for name, statement in ddl.items():
+            if name not in existing:
+                connection.execute(statement)
+        if engine.dialect.name == 'sqlite' and 'questions_fts' not in existing:
+            connection.execute(
+                "INSERT INTO questions_fts(questions_fts) VALUES ('rebuild')")
+
+
+def install_search_ddl(table):
+    '''
+    keeps the search indexes in step with db.create_all() and db.drop_all()
+    '''
+    for statement in POSTGRES_SEARCH_DDL.values():
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='postgresql'))
+    for statement in SQLITE_SEARCH_DDL.values():
+        event.listen(table, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+    event.listen(table, 'before_drop', DDL(
+        'DROP TABLE IF EXISTS questions_fts').execute_if(dialect='sqlite'))
+
+
+def question_search_for(session, model):
+    dialect = session.get_bind().dialect.name
+    if dialect == 'postgresql':
+        return PostgresQuestionSearch(session, model)
+    if dialect == 'sqlite':
+        return SQLiteQuestionSearch(session, model)
+    return LikeQuestionSearch(session, model)
+
+
+def escape_like(term):
+    return (term.replace('\\', '\\\\')
+            .replace('%', '\\%')
+            .replace('_', '\\_'))
+
+
+class QuestionSearch:
+    def __init__(self, session, model):
+        self.session = session
+        self.model = model
+
+    def search(self, term, page, per_page):
+        '''
+        returns (questions on the page, total number of matches)
+        '''
+        offset = (page - 1) * per_page
+        rows = (self.matches(term)
+                .limit(per_page)
+                .offset(offset)
+                .all())
+        if not rows:
+            return [], 0
+        return [row[0] for row in rows], rows[0][1]
+
+    def matches(self, term):
+        raise NotImplementedError()
+
+
+class LikeQuestionSearch(QuestionSearch):
+    def matches(self, term):
+        pattern = '%{}%'.format(escape_like(term.lower()))
+        question = func.lower(self.model.question)
+        answer = func.lower(self.model.answer)
+        return (self.session.query(self.model, func.count().over())
+                .filter(or_(question.like(pattern, escape='\\'),
+                            answer.like(pattern, escape='\\')))
+                .order_by(question.like(pattern, escape='\\').desc(), self.model.id))
+
+
+class PostgresQuestionSearch(QuestionSearch):
+    def matches(self, term):
+        pattern = '%{}%'.format(escape_like(term))
+        rank = func.greatest(
+            func.word_similarity(term, self.model.question),
+            func.word_similarity(term, self.model.answer) * 0.5)
+        return (self.session.query(self.model, func.count().over())
+                .filter(or_(self.model.question.ilike(pattern, escape='\\'),
+                            self.model.answer.ilike(pattern, escape='\\')))
+                .order_by(rank.desc(), self.model.id))
+
+
+class SQLiteQuestionSearch(QuestionSearch):
+    # The trigram tokenizer cannot match anything shorter
+    MIN_TERM_LENGTH = 3
+
+    def matches(self, term):
+        if len(term) < self.MIN_TERM_LENGTH:
+            return LikeQuestionSearch(self.session, self.model).matches(term)
+
+        # A quoted FTS5 string is matched as a substring. bm25() has to be
+        # evaluated by the full-text scan itself, before the window count
+        phrase = '"{}"'.format(term.replace('"', '""'))
+        ranked = (text("""
+            SELECT rowid, bm25(questions_fts, 1.0, 0.5) AS rank
+            FROM questions_fts WHERE questions_fts MATCH :phrase""")
+                  .bindparams(phrase=phrase)
+                  .columns(rowid=Integer, rank=Float)
+                  .alias('ranked'))
+        return (self.session.query(self.model, func.count().over())
+                .join(ranked, ranked.c.rowid == self.model.id)
+                .order_by(ranked.c.rank, self.model.id))
@@ -2,10 +2,15 @@ import os
 import unittest
 import json
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import (setup_db, db, Question, Category, QuestionCounter, QuestionIdIndex,
+                    category_cache, database_path)
 from config import database_credentials
+from query_profiler import assert_max_queries
+from question_search import install_question_search
+from db_engine import engine_options
 
 
 class TriviaTestCase(unittest.TestCase):
@@ -46,12 +51,48 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertTrue(data['success'], True)
         self.assertTrue(len(data['categories']) > 0)
-    
 
+    def test_get_all_categories_not_modified(self):
+        res = self.client().get('/categories')
+        etag = res.headers.get('ETag')
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+
+        self.assertTrue(etag)
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+
+    def test_category_cache_counts_one_hit_per_request(self):
+        self.client().get('/categories')
+        before = category_cache.stats()
+
+        etag = self.client().get('/categories').headers.get('ETag')
+        self.client().get('/categories', headers={'If-None-Match': etag})
+        after = category_cache.stats()
+
+        self.assertEqual(after['hits'] - before['hits'], 2)
+        self.assertEqual(after['misses'], before['misses'])
+
+    def test_category_cache_invalidated_on_write(self):
+        res = self.client().get('/categories')
+        etag = res.headers.get('ETag')
+
+        with self.app.app_context():
+            category = Category(type='Cooking')
+            db.session.add(category)
+            db.session.commit()
+            category_id = category.id
+
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            db.session.delete(Category.query.get(category_id))
+            db.session.commit()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('Cooking', data['categories'])
     
-     
-            
-           
 
     
     def test_error_405_get_all_categories(self):
@@ -129,7 +170,50 @@ class TriviaTestCase(unittest.TestCase):
 
         self.assertEqual(res.status_code, 404)
         self.assertEqual(data['success'], False)
-    
+
+    def test_search_question_matches_answers_ignoring_case(self):
+        create_question = {
+            'question' : 'Who painted the Mona Lisa?',
+            'answer' : 'Leonardo da Vinci',
+            'category' : '2',
+            'difficulty' : 1
+        }
+        res = self.client().post('/questions', json = create_question)
+        question_id = json.loads(res.data)['created']
+
+        res = self.client().post('/questions/search', json = {'searchTerm' : 'DA VINCI'})
+        data = json.loads(res.data)
+        self.client().delete('/questions/{}'.format(question_id))
+
+        self.assertEqual(res.status_code, 200)
+        self.assertIn(question_id, [question['id'] for question in data['questions']])
+        self.assertEqual(data['matching_questions'], len(data['questions']))
+        self.assertTrue(data['total_questions'] >= data['matching_questions'])
+
+    def test_error_400_search_question_blank(self):
+        res = self.client().post('/questions/search', json = {'searchTerm' : ' '})
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(data['message'], 'searchTerm can not be blank')
+
+    def test_search_setup_only_reads_catalog_once_installed(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                install_question_search(db.engine)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+
+        # No DDL, which would need the rights to create pg_trgm
+        self.assertEqual(len(statements), 1)
+        self.assertTrue(statements[0].strip().startswith('SELECT'))
+
     #Test get paginated questions endpoint
     def test_error_405_get_all_questions_paginated(self):
         res = self.client().patch('/questions')
@@ -157,6 +241,35 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['success'])
         self.assertTrue(data['total_questions'] > 0)
 
+
+    def test_get_questions_returns_one_page(self):
+        res = self.client().get('/questions?page=2')
+        data = json.loads(res.data)
+
+        with self.app.app_context():
+            total_questions = Question.query.count()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(0 < len(data['questions']) <= 10)
+        self.assertEqual(data['total_questions'], total_questions)
+        self.assertTrue(all(question['id'] > 0 for question in data['questions']))
+
+    def test_question_pages_stay_within_query_budget(self):
+        budgets = {'/categories': 1, '/questions?page=1': 2, '/categories/1/questions': 2}
+
+        for path, budget in budgets.items():
+            with assert_max_queries(self.app, budget):
+                res = self.client().get(path)
+
+            self.assertEqual(res.status_code, 200)
+            self.assertIn('db;desc=', res.headers['Server-Timing'])
+
+    def test_error_404_get_questions_page_zero(self):
+        res = self.client().get('/questions?page=0')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
     
     #Test delete questions endpoint
     def test_delete_question(self):
@@ -209,6 +322,16 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['total_questions'] > 0)
         self.assertEqual(data['current_category'], 1)
 
+    def test_question_counter_counts_integer_category_ids(self):
+        counter = QuestionCounter()
+        with self.app.app_context():
+            by_int, by_str = counter.count(1), counter.count('1')
+            expected = Question.query.filter(Question.category == '1').count()
+
+        self.assertEqual(by_int, expected)
+        self.assertEqual(by_str, expected)
+        self.assertTrue(expected > 0)
+
     #Test for posting quizzes
     def test_error_405_play_quiz(self):
         res = self.client().get('/quizzes')
@@ -246,6 +369,151 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['question']['id'] not in play_quizz['previous_questions'])
 
 
+    def test_play_quiz_all_categories(self):
+        play_quizz = {
+            'previous_questions' : [],
+            'quiz_category' : {
+                'type' : 'click',
+                'id' : 0
+                }
+        } 
+        res = self.client().post('/quizzes', json = play_quizz)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertTrue(data['question']['question'])
+
+    def test_play_quiz_ends_when_all_questions_asked(self):
+        with self.app.app_context():
+            asked = [question.id for question in Question.query.filter(
+                Question.category == '1').all()]
+
+        play_quizz = {
+            'previous_questions' : asked,
+            'quiz_category' : {
+                'type' : 'Science',
+                'id' : '1'
+                }
+        } 
+        res = self.client().post('/quizzes', json = play_quizz)
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+        self.assertEqual(data['question'], None)
+    #Test quiz sessions
+    def test_quiz_session_asks_each_question_once(self):
+        res = self.client().post('/quizzes/sessions', json = {
+            'quiz_category' : {'type' : 'Science', 'id' : '1'}
+        })
+        data = json.loads(res.data)
+        session_id = data['session_id']
+
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(data['success'])
+
+        asked = []
+        for _ in range(data['total_questions'] + 1):
+            res = self.client().post('/quizzes/sessions/{}/next'.format(session_id))
+            question = json.loads(res.data)['question']
+            if not question:
+                break
+            self.assertEqual(str(question['category']), '1')
+            asked.append(question['id'])
+
+        self.assertEqual(len(asked), data['total_questions'])
+        self.assertEqual(len(set(asked)), len(asked))
+
+    def test_quiz_session_survives_deletes(self):
+        with self.app.app_context():
+            added = []
+            for i in range(3):
+                question = Question('Added question {}?'.format(i), 'Answer', '1', 1)
+                question.insert()
+                added.append(question.id)
+
+        def next_question(session_id):
+            return json.loads(self.client().post(
+                '/quizzes/sessions/{}/next'.format(session_id)).data)['question']
+
+        # Deleting a question moves the last id of the category, added[-1],
+        # into its slot. Play until added[-1] is asked while other added
+        # questions aren't, then delete one of those.
+        for _ in range(20):
+            session_id = json.loads(self.client().post('/quizzes/sessions', json={
+                'quiz_category': {'type': 'Science', 'id': '1'}}).data)['session_id']
+            asked = []
+            while added[-1] not in asked:
+                asked.append(next_question(session_id)['id'])
+            unasked = [question_id for question_id in added if question_id not in asked]
+            if unasked:
+                break
+        deleted = unasked[0]
+        with self.app.app_context():
+            Question.query.get(deleted).delete()
+            category_ids = [question.id for question in
+                            Question.query.filter(Question.category == '1')]
+
+        while True:
+            question = next_question(session_id)
+            if not question:
+                break
+            asked.append(question['id'])
+
+        with self.app.app_context():
+            for question_id in added:
+                question = Question.query.get(question_id)
+                if question:
+                    question.delete()
+
+        self.assertEqual(len(set(asked)), len(asked))
+        self.assertNotIn(deleted, asked)
+        self.assertEqual(sorted(asked), sorted(category_ids))
+
+    def test_question_id_index_remove(self):
+        index = QuestionIdIndex()
+        with self.app.app_context():
+            size = index.size('1')
+            first, last = index.id_at('1', 0), index.id_at('1', size - 1)
+            index.remove('1', first)
+            ids = [index.id_at('1', position) for position in range(size)]
+
+        self.assertEqual(index.size('1'), size - 1)
+        self.assertNotIn(first, ids)
+        self.assertEqual(ids[0], last)
+        self.assertIsNone(ids[-1])
+
+    def test_404_quiz_session_not_found(self):
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(data['success'], False)
+        self.assertEqual(data['message'], 'Quiz session unknown not found.')
+
+    # Test for the pool debug end point
+    def test_statement_timeout_reaches_trivia_database(self):
+        options = engine_options(database_path, {'DB_STATEMENT_TIMEOUT': '500'})
+
+        self.assertTrue(database_path.startswith('postgres://'))
+        self.assertEqual(options['connect_args'], {'options': '-c statement_timeout=500'})
+
+    def test_debug_pool_is_not_exposed_by_default(self):
+        res = self.client().get('/debug/pool')
+
+        self.assertEqual(res.status_code, 404)
+
+    def test_debug_pool(self):
+        client = create_app({'debug_pool': True}).test_client
+        client().get('/categories')
+        res = client().get('/debug/pool')
+        data = json.loads(res.data)
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['pool'], 'TimedQueuePool')
+        self.assertEqual(data['checked_out'], 0)
+        self.assertTrue(data['checkouts'] >= 1)
 
     
 
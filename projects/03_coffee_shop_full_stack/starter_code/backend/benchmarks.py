@@ -0,0 +1,186 @@
+'''
+Benchmarks for the coffee shop backend:
+
+    python benchmarks.py permissions
+    python benchmarks.py sqlite
+    python benchmarks.py startup
+'''
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import timeit
+
+from sqlalchemy import create_engine, exc, select
+from sqlalchemy.pool import NullPool
+from statistics import median
+
+from src.auth.auth import check_permissions
+from src.auth.permissions import TokenPayload, any_of
+from src.database.models import Drink
+from src.database.sqlite_profiles import PROFILES
+
+PERMISSION_COUNTS = [5, 50, 500]
+CHECKS = 100000
+
+
+def token_permissions(count):
+    return ['{}:resource-{}'.format(action, i)
+            for i in range(count // 4 + 1)
+            for action in ('get', 'post', 'patch', 'delete')][:count]
+
+
+def benchmark_permissions():
+    '''
+    time per permission check against a list of permissions, as tokens
+    carried them so far, and against the token's precomputed permission set.
+    The list is checked for its last permission, the worst case for a scan.
+    '''
+    print('{:>12} {:>24} {:>12} {:>12}'.format(
+        'permissions', 'check', 'list (ns)', 'set (ns)'))
+
+    for count in PERMISSION_COUNTS:
+        permissions = token_permissions(count)
+        payload = TokenPayload({'permissions': permissions})
+        last = permissions[-1]
+        compound = any_of('get:missing', last)
+
+        checks = [
+            ('membership', lambda: last in permissions,
+             lambda: last in payload.permission_set),
+            # What check_permissions() did with the list
+            ('check_permissions', lambda: 'permissions' in payload and last in payload['permissions'],
+             lambda: check_permissions(last, payload)),
+            ('any_of', lambda: 'get:missing' in permissions or last in permissions,
+             lambda: compound.satisfied_by(payload.permission_set)),
+        ]
+        for name, with_list, with_set in checks:
+            print('{:>12} {:>24} {:>12.1f} {:>12.1f}'.format(
+                count, name,
+                timeit.timeit(with_list, number=CHECKS) / CHECKS * 1e9,
+                timeit.timeit(with_set, number=CHECKS) / CHECKS * 1e9))
+
+        print('{:>12} {:>24} {:>12.1f}'.format(
+            count, 'building the set (us)',
+            timeit.timeit(lambda: TokenPayload({'permissions': permissions}),
+                          number=1000) / 1000 * 1e6))
+
+
+READERS = 8
+WRITERS = 4
+DURATION = 5
+MENU_SIZE = 200
+
+
+def profile_engine(profile, path):
+    options = profile.engine_options()
+    if not options:
+        # What Flask-SQLAlchemy picks for an SQLite file without pool_size
+        options = {'poolclass': NullPool}
+    engine = create_engine('sqlite:///' + path, **options)
+    profile.install(engine)
+    return engine
+
+
+def benchmark_sqlite():
+    '''
+    menu reads and drink writes per second, from READERS and WRITERS threads
+    sharing the database for DURATION seconds, with each SQLite profile.
+    Failed operations are the ones that gave up with "database is locked".
+    '''
+    recipe = json.dumps([{'name': 'milk', 'color': 'grey', 'parts': 1}])
+    print('{:>8} {:>10} {:>10} {:>14} {:>14} {:>8}'.format(
+        'profile', 'reads/s', 'writes/s', 'read p99 (ms)', 'write p99 (ms)', 'failed'))
+
+    for name, make_profile in PROFILES.items():
+        profile = make_profile()
+        with tempfile.TemporaryDirectory() as directory:
+            engine = profile_engine(profile, os.path.join(directory, 'benchmark.db'))
+            Drink.__table__.create(engine)
+            engine.execute(Drink.__table__.insert(), [
+                {'title': 'Drink {}'.format(i), 'recipe': recipe} for i in range(MENU_SIZE)])
+
+            deadline = time.monotonic() + DURATION
+            timings = {'read': [], 'write': []}
+            failures = []
+
+            def read():
+                with engine.connect() as connection:
+                    connection.execute(select([Drink.__table__])).fetchall()
+
+            def write(worker, count):
+                with engine.begin() as connection:
+                    connection.execute(Drink.__table__.insert(), {
+                        'title': 'New drink {}-{}'.format(worker, count), 'recipe': recipe})
+                    connection.execute(Drink.__table__.update()
+                                       .where(Drink.__table__.c.id == count % MENU_SIZE + 1)
+                                       .values(recipe=recipe))
+
+            def run(kind, worker):
+                count = 0
+                while time.monotonic() < deadline:
+                    count += 1
+                    started = time.perf_counter()
+                    try:
+                        if kind == 'read':
+                            read()
+                        else:
+                            write(worker, count)
+                    except exc.OperationalError:
+                        failures.append(kind)
+                        continue
+                    timings[kind].append(time.perf_counter() - started)
+
+            threads = [threading.Thread(target=run, args=('read', i)) for i in range(READERS)]
+            threads += [threading.Thread(target=run, args=('write', i)) for i in range(WRITERS)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            engine.dispose()
+
+        def p99(values):
+            values = sorted(values)
+            return values[int(len(values) * 0.99)] * 1000 if values else float('nan')
+
+        print('{:>8} {:>10.0f} {:>10.0f} {:>14.2f} {:>14.2f} {:>8}'.format(
+            name, len(timings['read']) / DURATION, len(timings['write']) / DURATION,
+            p99(timings['read']), p99(timings['write']), len(failures)))
+
+
+STARTUPS = 20
+
+
+def benchmark_startup():
+    '''
+    time db_startup() takes on the server's database (DATABASE_URL), when
+    the app is imported and then on STARTUPS restarts with an up to date
+    schema, against STARTUP_BUDGET. Exits with status 1 when the slowest
+    restart is over budget.
+    '''
+    from src.api import app, startup_seconds
+    from src.database.models import STARTUP_BUDGET, db_startup
+
+    with app.app_context():
+        restarts = [db_startup() for _ in range(STARTUPS)]
+    print('{:>14} {:>12}'.format('startup', 'ms'))
+    print('{:>14} {:>12.3f}'.format('app import', startup_seconds * 1000))
+    print('{:>14} {:>12.3f}'.format('restart p50', median(restarts) * 1000))
+    print('{:>14} {:>12.3f}'.format('restart max', max(restarts) * 1000))
+    print('{:>14} {:>12.3f}'.format('budget', STARTUP_BUDGET * 1000))
+    if max(restarts) > STARTUP_BUDGET:
+        sys.exit('restart over the {:.0f} ms budget'.format(STARTUP_BUDGET * 1000))
+
+
+BENCHMARKS = {
+    'permissions': benchmark_permissions,
+    'sqlite': benchmark_sqlite,
+    'startup': benchmark_startup,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHMARKS:
+        print('# {}'.format(name))
+        BENCHMARKS[name]()
@@ -4,19 +4,47 @@ from sqlalchemy import exc
 import json
 from flask_cors import CORS
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
+from .database.query_profiler import QueryProfiler
+from .database.models import db_drop_and_create_all, db_startup, setup_db, db, Drink, menu_cache
 from .auth.auth import AuthError, requires_auth
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+# Query count and database time per request, see query_profiler.py
+QueryProfiler(app)
 
 '''
-@TODO uncomment the following line to initialize the datbase
-!! NOTE THIS WILL DROP ALL RECORDS AND START YOUR DB FROM SCRATCH
-!! NOTE THIS MUST BE UNCOMMENTED ON FIRST RUN
+Creates and seeds the database on first run and upgrades its schema when
+needed, existing records are kept. To drop all records and start the
+database from scratch, run
+    flask reset-db
 '''
-db_drop_and_create_all()
+startup_seconds = db_startup()
+app.logger.info('Database ready in %.1f ms', startup_seconds * 1000)
+
+
+@app.cli.command('reset-db')
+def reset_db():
+    """Drops all records and starts the database from the seed drinks."""
+    db_drop_and_create_all()
+
+
+def render_menu(view):
+    drinks = Drink.query.order_by(Drink.id).all()
+    return json.dumps({
+        'success': True,
+        'drinks': [getattr(drink, view)() for drink in drinks]
+    }).encode()
+
+
+def menu_response(view):
+    # The menu is served from menu_cache, see models.py
+    body, etag = menu_cache.get(view, lambda: render_menu(view))
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response.make_conditional(request)
+
 
 # ROUTES
 '''
@@ -31,12 +59,7 @@ db_drop_and_create_all()
 
 @app.route('/drinks', methods=['GET'])
 def get_drink():
-    drinks = Drink.query.all()
-    drinks = [drink.short() for drink in drinks]
-    return jsonify({
-        'success': True,
-        'drinks': drinks
-    }), 200
+    return menu_response('short')
 
 
 '''
@@ -53,12 +76,7 @@ def get_drink():
 @requires_auth('get:drinks-detail')
 def drinks_detail(payload):
     try:
-        drinks = Drink.query.all()
-        detail_drinks = [drink.long() for drink in drinks]
-        return jsonify({
-            'success': True,
-            'drinks': detail_drinks
-        }), 200
+        return menu_response('long')
     except:
         abort(422)
 
@@ -74,33 +92,50 @@ def drinks_detail(payload):
 '''
 
 
+def drink_from(data):
+    # Returns a new Drink for a request body, or None when it is invalid
+    if not isinstance(data, dict):
+        return None
+    title = data.get('title')
+    recipe = data.get('recipe')
+    if not title or not isinstance(title, str):
+        return None
+    if not recipe or not isinstance(recipe, list):
+        return None
+    if not all(isinstance(ingredient, dict) for ingredient in recipe):
+        return None
+    return Drink(title=title, recipe=json.dumps(recipe))
+
+
 @app.route('/drinks', methods=['POST'])
 @requires_auth('post:drinks')
 def create_drinks(payload):
-    try:
-        data = request.get_json()['title'] and request.get_json()['recipe']
-        if not data:
-            abort(400)
-    except (TypeError, KeyError):
-        abort(400)
-
-    if Drink.query.filter_by(title=request.get_json()['title']).first():
+    body = request.get_json(silent=True)
+    # A list of drinks is created in one transaction, all or none of them
+    drinks = [drink_from(data)
+              for data in (body if isinstance(body, list) else [body])]
+    if not drinks or None in drinks:
         abort(400)
 
     try:
-        Drink(
-            title=request.get_json()['title'],
-            recipe=json.dumps(request.get_json()['recipe'])
-        ).insert()
-        drink = Drink.query.filter_by(
-            title=request.get_json()['title']).first()
-        return jsonify({
-            'success': True,
-            'drinks': drink.long()
-        }), 200
-    except:
+        db.session.add_all(drinks)
+        db.session.flush()
+        # Serialized before the commit expires the new rows
+        created = [drink.long() for drink in drinks]
+        db.session.commit()
+    except exc.IntegrityError:
+        # A title is already taken
+        db.session.rollback()
+        abort(400)
+    except exc.SQLAlchemyError:
+        db.session.rollback()
         abort(422)
 
+    return jsonify({
+        'success': True,
+        'drinks': created
+    }), 200
+
 
 '''
 @TODO implement endpoint
@@ -128,7 +163,7 @@ def update_drink(payload, drink_id):
     if updated_title:
         drink_to_update.title = body['title']
     if updated_recipe:
-        drink_to_update.recipe = """{}""".format(body['recipe'])
+        drink_to_update.recipe = json.dumps(body['recipe'])
 
     drink_to_update.update()
     return jsonify({
@@ -150,7 +185,7 @@ def update_drink(payload, drink_id):
 
 
 @app.route('/drinks/<int:drink_id>',  methods=['DELETE'])
-@requires_auth('delete:drinks')
+@requires_auth('delete:drinks', bypass_cache=True)
 def delete_drinks(payload, drink_id):
     """Deletes 1 drink with given id"""
     if not drink_id:
@@ -1,14 +1,21 @@
-import json
 from flask import request, _request_ctx_stack
 from functools import wraps
 from jose import jwt
-from urllib.request import urlopen
+
+from .jwks import JWKSError, JWKSKeyStore
+from .permissions import TokenPayload, all_of, any_of, permission_set, requirement
+from .token_cache import VerifiedTokenCache
 
 
 AUTH0_DOMAIN = 'cofee-shop-udacity.eu.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'http://localhost:5000'
 
+# Signing keys are cached between requests, see jwks.py
+jwks_store = JWKSKeyStore(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# Payloads of verified tokens are reused until they expire, see token_cache.py
+token_cache = VerifiedTokenCache()
+
 
 
 class AuthError(Exception):
@@ -43,11 +50,15 @@ def get_token_auth_header():
 
 
 def check_permissions(permission, payload):
+    # permission is a permission name or a requirement from permissions.py
     if 'permissions' not in payload:
         raise AuthError({
             "code": "Invalid claims",
             "description": "JWT doesnt contain Permissions"}, 401)
-    if permission not in payload['permissions']:
+    permissions = getattr(payload, 'permission_set', None)
+    if permissions is None:
+        permissions = permission_set(payload['permissions'])
+    if not requirement(permission).satisfied_by(permissions):
         raise AuthError({
             "code": "You are Unauthorized",
             "description": "Permissions not found"}, 401)
@@ -58,9 +69,6 @@ def check_permissions(permission, payload):
 
 
 def verify_decode_jwt(token):
-
-    jsonurl = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    jwks = json.loads(jsonurl.read())
     unverified_header = jwt.get_unverified_header(token)
 
     if "kid" not in unverified_header:
@@ -68,17 +76,15 @@ def verify_decode_jwt(token):
             'code': 'invalid_header',
             'description': 'Authorization malformed.'
         }, 401)
-    rsa_key = {}
-
-    for key in jwks['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
+
+    try:
+        rsa_key = jwks_store.get_key(unverified_header['kid'])
+    except JWKSError:
+        raise AuthError({
+            'code': 'keys_unavailable',
+            'description': 'Unable to fetch the signing keys.'
+        }, 503)
+
     if rsa_key:
         try:
             payload = jwt.decode(
@@ -88,7 +94,7 @@ def verify_decode_jwt(token):
                 audience=API_AUDIENCE,
                 issuer='https://' + AUTH0_DOMAIN + '/'
             )
-            return payload
+            return TokenPayload(payload)
         except jwt.ExpiredSignatureError:
             raise AuthError({
                 "code": "Expired_token",
@@ -114,13 +120,19 @@ def verify_decode_jwt(token):
 
 
 
-def requires_auth(permission=''):
+def requires_auth(permission='', bypass_cache=False):
+    # permission is a permission name, 'get:*' / '*:drinks' for any
+    # permission on an action or a resource, or any_of(...) / all_of(...)
+    # bypass_cache verifies the token on every request, for permissions
+    # that should not be granted on the strength of an earlier check
+    required = requirement(permission)
+
     def requires_auth_decorator(f):
         @wraps(f)
         def wrapper(*args, **kwargs):
             token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
+            payload = token_cache.verify(token, verify_decode_jwt, bypass_cache)
+            check_permissions(required, payload)
             return f(payload, *args, **kwargs)
 
         return wrapper
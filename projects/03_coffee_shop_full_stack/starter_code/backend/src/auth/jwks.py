@@ -0,0 +1,149 @@
+import json
+import logging
+import re
+import threading
+import time
+from urllib.request import urlopen
+
+'''
+JWKS key store
+    caches the identity provider's signing keys by kid, so verifying a token
+    does not wait on a request to the JWKS endpoint.
+
+    The key set is fetched on first use and kept for the max-age of its
+    Cache-Control header (clamped to [min_ttl, max_ttl], default_ttl when
+    there is none). Once it expires the cached keys are still served while a
+    background thread fetches a fresh copy. A kid that is not in the cache
+    triggers an immediate fetch, at most once every unknown_kid_interval
+    seconds, so that tokens with made up kids cannot flood the provider.
+    When a fetch fails the keys already cached keep being served and the
+    fetch is retried after min_ttl seconds.
+'''
+
+logger = logging.getLogger(__name__)
+
+MAX_AGE = re.compile(r'max-age\s*=\s*"?(\d+)')
+
+
+class JWKSError(Exception):
+    pass
+
+
+def cache_max_age(cache_control):
+    '''
+    returns the max-age of a Cache-Control header in seconds, 0 when the
+    response must not be reused and None when it does not say
+    '''
+    directives = (cache_control or '').lower()
+    if 'no-store' in directives or 'no-cache' in directives:
+        return 0
+    match = MAX_AGE.search(directives)
+    return int(match.group(1)) if match else None
+
+
+def fetch_jwks(url, timeout):
+    '''
+    returns the JWKS document at url (http(s):// or file://) and the max-age
+    of the response
+    '''
+    with urlopen(url, timeout=timeout) as response:
+        jwks = json.loads(response.read())
+        cache_control = response.headers.get('Cache-Control')
+    return jwks, cache_max_age(cache_control)
+
+
+def rsa_key(key):
+    return {
+        'kty': key['kty'],
+        'kid': key['kid'],
+        'use': key.get('use', 'sig'),
+        'n': key['n'],
+        'e': key['e']
+    }
+
+
+class JWKSKeyStore:
+    def __init__(self, url, default_ttl=600, min_ttl=30, max_ttl=86400,
+                 unknown_kid_interval=30, timeout=5, fetch=fetch_jwks):
+        self.url = url
+        self.default_ttl = default_ttl
+        self.min_ttl = min_ttl
+        self.max_ttl = max_ttl
+        self.unknown_kid_interval = unknown_kid_interval
+        self.timeout = timeout
+        self.fetch = fetch
+
+        self.keys = {}
+        self.expires_at = 0
+        self.last_fetch = None
+        self.fetch_lock = threading.Lock()
+        self.refreshing = False
+        self.refreshing_lock = threading.Lock()
+        self.fetches = 0
+        self.failures = 0
+
+    def get_key(self, kid):
+        '''
+        returns the RSA key for kid, or None when the provider doesn't know
+        it. Raises JWKSError when no key set could be fetched at all.
+        '''
+        if not self.keys:
+            self.refresh(self.unknown_kid_interval)
+            if not self.keys:
+                raise JWKSError('No signing keys available from {}'.format(self.url))
+        elif time.monotonic() >= self.expires_at:
+            self.refresh_in_background()
+
+        key = self.keys.get(kid)
+        if key is None and self.refresh(self.unknown_kid_interval):
+            key = self.keys.get(kid)
+        return key
+
+    def refresh(self, min_interval=0):
+        '''
+        fetches the key set, unless another fetch started less than
+        min_interval seconds ago. Returns True when the keys were replaced.
+        '''
+        with self.fetch_lock:
+            now = time.monotonic()
+            if self.last_fetch is not None and now - self.last_fetch < min_interval:
+                return False
+            self.last_fetch = now
+
+            try:
+                jwks, max_age = self.fetch(self.url, self.timeout)
+                keys = {key['kid']: rsa_key(key) for key in jwks['keys']}
+            except Exception as error:
+                self.failures += 1
+                self.expires_at = now + self.min_ttl
+                logger.warning('Fetching %s failed, keeping %d cached keys: %s',
+                               self.url, len(self.keys), error)
+                return False
+
+            if max_age is None:
+                max_age = self.default_ttl
+            self.keys = keys
+            self.expires_at = now + min(max(max_age, self.min_ttl), self.max_ttl)
+            self.fetches += 1
+            return True
+
+    def refresh_in_background(self):
+        with self.refreshing_lock:
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self.background_refresh, daemon=True).start()
+
+    def background_refresh(self):
+        try:
+            self.refresh()
+        finally:
+            self.refreshing = False
+
+    def stats(self):
+        return {
+            'keys': len(self.keys),
+            'fetches': self.fetches,
+            'failures': self.failures,
+            'expires_in': max(self.expires_at - time.monotonic(), 0)
+        }
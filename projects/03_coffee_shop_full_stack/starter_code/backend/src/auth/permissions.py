@@ -0,0 +1,95 @@
+'''
+Permission requirements
+    what a token must be granted to reach an endpoint, checked against the
+    token's permissions as a frozenset built once per token (TokenPayload),
+    so every check is a set lookup whatever the number of permissions.
+
+    requires_auth() accepts
+        'post:drinks'                           a single permission
+        'get:*', '*:drinks'                     any permission for the action
+                                                or for the resource
+        any_of('patch:drinks', 'post:drinks')   at least one of
+        all_of('get:drinks-detail', any_of(...))
+                                                every one of, nesting allowed
+'''
+
+WILDCARD = '*'
+
+
+def permission_set(permissions):
+    '''
+    returns the permissions with the wildcard scopes they satisfy, so that
+    'get:drinks' also grants 'get:*' and '*:drinks'
+    '''
+    scopes = set(permissions)
+    for permission in permissions:
+        action, separator, resource = permission.partition(':')
+        if separator:
+            scopes.add(action + ':' + WILDCARD)
+            scopes.add(WILDCARD + ':' + resource)
+    return frozenset(scopes)
+
+
+class TokenPayload(dict):
+    '''
+    decoded token claims, along with the permission_set() of its permissions
+    '''
+    def __init__(self, claims):
+        super().__init__(claims)
+        permissions = self.get('permissions')
+        self.permission_set = permission_set(
+            permissions if isinstance(permissions, list) else [])
+
+
+class Requirement:
+    def satisfied_by(self, permissions):
+        raise NotImplementedError()
+
+
+class Permission(Requirement):
+    def __init__(self, name):
+        self.name = name
+
+    def satisfied_by(self, permissions):
+        return self.name in permissions
+
+    def __repr__(self):
+        return repr(self.name)
+
+
+class AnyOf(Requirement):
+    def __init__(self, requirements):
+        self.requirements = requirements
+
+    def satisfied_by(self, permissions):
+        return any(requirement.satisfied_by(permissions)
+                   for requirement in self.requirements)
+
+    def __repr__(self):
+        return 'any_of({})'.format(', '.join(map(repr, self.requirements)))
+
+
+class AllOf(Requirement):
+    def __init__(self, requirements):
+        self.requirements = requirements
+
+    def satisfied_by(self, permissions):
+        return all(requirement.satisfied_by(permissions)
+                   for requirement in self.requirements)
+
+    def __repr__(self):
+        return 'all_of({})'.format(', '.join(map(repr, self.requirements)))
+
+
+def requirement(permission):
+    if isinstance(permission, Requirement):
+        return permission
+    return Permission(permission)
+
+
+def any_of(*permissions):
+    return AnyOf(tuple(requirement(permission) for permission in permissions))
+
+
+def all_of(*permissions):
+    return AllOf(tuple(requirement(permission) for permission in permissions))
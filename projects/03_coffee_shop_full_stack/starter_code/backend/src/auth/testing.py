@@ -0,0 +1,70 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+'''
+Stand-ins for the identity provider's JWKS endpoint, for tests
+
+    jwks_file_url()  writes a key set to a file and returns its file:// url,
+                     urlopen() reads it like any other url
+    JWKSStandIn      serves a key set over HTTP on localhost, with a
+                     configurable Cache-Control header. Counts the requests
+                     it gets and can be switched to fail them.
+'''
+
+
+def jwks_file_url(path, jwks):
+    with open(path, 'w') as jwks_file:
+        json.dump(jwks, jwks_file)
+    return 'file://' + os.path.abspath(path)
+
+
+class JWKSStandIn:
+    def __init__(self, jwks, cache_control='max-age=600'):
+        self.jwks = jwks
+        self.cache_control = cache_control
+        self.failing = False
+        self.requests = 0
+        self.server = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return 'http://{}:{}/.well-known/jwks.json'.format(host, port)
+
+    def start(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stand_in.requests += 1
+                if stand_in.failing:
+                    self.send_error(503)
+                    return
+                body = json.dumps(stand_in.jwks).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                if stand_in.cache_control:
+                    self.send_header('Cache-Control', stand_in.cache_control)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = HTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.server.serve_forever, args=(0.05,),
+                         daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
@@ -0,0 +1,105 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+'''
+Verified token cache
+    remembers the payload of tokens whose signature and claims have already
+    been verified, so a client sending the same bearer token again skips
+    the RS256 verification. Entries are keyed by the SHA-256 of the token,
+    so tokens are not kept in memory, and are dropped at the token's exp or
+    when the least recently used ones are evicted past max_entries. Tokens
+    without an exp are never cached.
+
+    Callers pass bypass=True for checks that must see a freshly verified
+    token every time, such as the ones guarding destructive permissions.
+
+    BasicFlaskAuth and the coffee shop API share no package, so each ships
+    this file: BasicFlaskAuth/token_cache.py and the coffee shop's
+    backend/src/auth/token_cache.py. The copies must stay identical; the
+    coffee shop's test_auth.py fails when they drift.
+'''
+
+
+class VerifiedTokenCache:
+    def __init__(self, max_entries=10000, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+        self.verify_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def key(self, token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        key = self.key(token)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            payload, expires_at, verify_seconds = entry
+            if expires_at <= self.clock():
+                del self.entries[key]
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += verify_seconds
+            return payload
+
+    def put(self, token, payload, verify_seconds=0.0):
+        expires_at = payload.get('exp') if isinstance(payload, dict) else None
+        if not isinstance(expires_at, (int, float)):
+            return
+        key = self.key(token)
+        with self.lock:
+            self.entries[key] = (payload, expires_at, verify_seconds)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def verify(self, token, verify, bypass=False):
+        '''
+        returns the cached payload of token, or verify(token) when it is not
+        cached, is expired or bypass is set. Errors raised by verify are not
+        cached.
+        '''
+        if bypass:
+            with self.lock:
+                self.bypasses += 1
+        else:
+            payload = self.get(token)
+            if payload is not None:
+                return payload
+
+        started = time.perf_counter()
+        payload = verify(token)
+        elapsed = time.perf_counter() - started
+        with self.lock:
+            self.verify_seconds += elapsed
+        self.put(token, payload, elapsed)
+        return payload
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self.entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'bypasses': self.bypasses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'verify_seconds': self.verify_seconds,
+                'saved_seconds': self.saved_seconds
+            }
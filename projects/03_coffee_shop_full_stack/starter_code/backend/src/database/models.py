@@ -1,32 +1,102 @@
 import os
-from sqlalchemy import Column, String, Integer
+import hashlib
+import time
+from functools import lru_cache
+from threading import Lock
+from sqlalchemy import Column, String, Integer, event
+from sqlalchemy.orm import Session, object_session
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .sqlite_profiles import sqlite_profile
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(
-    os.path.join(project_dir, database_filename))
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(
+    os.path.join(project_dir, database_filename)))
+
+# Version of the schema defined below, stored in the database file as
+# PRAGMA user_version. Bump it along with a new entry in MIGRATIONS.
+SCHEMA_VERSION = 1
+
+# MIGRATIONS[n] lists the statements upgrading a version n database to
+# n + 1. Version 0 is a database created by db_drop_and_create_all()
+# before versions were recorded, its tables are already those of version 1.
+MIGRATIONS = {
+    0: [],
+}
 
 db = SQLAlchemy()
 
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
+    connecting with an SQLite profile from sqlite_profiles.py
 '''
 
 
-def setup_db(app):
+def setup_db(app, profile=None):
+    profile = sqlite_profile(profile)
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = profile.engine_options()
     db.app = app
     db.init_app(app)
+    profile.install(db.get_engine(app))
+
+
+'''
+db_startup()
+    gets the database ready without touching existing records: creates and
+    seeds the tables of a new database, upgrades an older schema, and leaves
+    an up to date one alone
+    returns the time it took in seconds, which on an up to date database
+    should stay under STARTUP_BUDGET
+'''
+
+STARTUP_BUDGET = 0.25
+
+
+def db_startup():
+    started = time.perf_counter()
+    if db_migrate_if_needed():
+        db_init_records()
+    return time.perf_counter() - started
+
+
+'''
+db_migrate_if_needed()
+    brings the schema to SCHEMA_VERSION
+    returns True when the tables had to be created
+'''
+
+
+def db_migrate_if_needed():
+    with db.engine.begin() as connection:
+        version = connection.execute('PRAGMA user_version').scalar()
+        if version == SCHEMA_VERSION:
+            return False
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(
+                'Database schema version {} is newer than this code ({})'.format(
+                    version, SCHEMA_VERSION))
+
+        created = not db.engine.dialect.has_table(connection, Drink.__tablename__)
+        if created:
+            db.Model.metadata.create_all(connection)
+        else:
+            for from_version in range(version, SCHEMA_VERSION):
+                for statement in MIGRATIONS[from_version]:
+                    connection.execute(statement)
+        connection.execute('PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
+    return created
 
 
 '''
 db_drop_and_create_all()
     drops the database tables and starts fresh
-    can be used to initialize a clean database
+    can be used to initialize a clean database, run it with
+        flask reset-db
     !!NOTE you can change the database_filename variable to have multiple verisons of a database
 '''
 
@@ -34,9 +104,11 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    db.session.execute('PRAGMA user_version = {:d}'.format(SCHEMA_VERSION))
     db_init_records()
 
-# Initialize when the server restarts
+# Adds the seed drinks that are missing, drinks already in the table are
+# left as they are
 
 
 def db_init_records():
@@ -74,8 +146,23 @@ def db_init_records():
                         ]"""
     ))
 
-    new_drink1.insert()
-    new_drink2.insert()
+    existing = {drink_id for (drink_id,) in db.session.query(Drink.id).filter(
+        Drink.id.in_([new_drink1.id, new_drink2.id]))}
+    db.session.add_all([drink for drink in (new_drink1, new_drink2)
+                        if drink.id not in existing])
+    db.session.commit()
+
+
+'''
+parse_recipe(recipe)
+    parses a recipe blob. The result is shared by every drink with the same
+    recipe text and must not be modified.
+'''
+
+
+@lru_cache(maxsize=1024)
+def parse_recipe(recipe):
+    return json.loads(recipe)
 
 
 '''
@@ -93,20 +180,25 @@ class Drink(db.Model):
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
     recipe = Column(String(180), nullable=False)
 
+    # short() and long() are computed once per instance, and recomputed
+    # after id, title or recipe change or the instance is expired
+    _short = None
+    _long = None
+
     '''
     short()
         short form representation of the Drink model
     '''
 
     def short(self):
-        print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']}
-                        for r in json.loads(self.recipe)]
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': short_recipe
-        }
+        if self._short is None:
+            self._short = {
+                'id': self.id,
+                'title': self.title,
+                'recipe': [{'color': r['color'], 'parts': r['parts']}
+                           for r in parse_recipe(self.recipe)]
+            }
+        return self._short
 
     '''
     long()
@@ -114,11 +206,17 @@ class Drink(db.Model):
     '''
 
     def long(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'recipe': json.loads(self.recipe)
-        }
+        if self._long is None:
+            self._long = {
+                'id': self.id,
+                'title': self.title,
+                'recipe': parse_recipe(self.recipe)
+            }
+        return self._long
+
+    def invalidate(self, *args):
+        self._short = None
+        self._long = None
 
     '''
     insert()
@@ -162,3 +260,74 @@ class Drink(db.Model):
 
     def __repr__(self):
         return json.dumps(self.short())
+
+
+for column in (Drink.id, Drink.title, Drink.recipe):
+    event.listen(column, 'set', Drink.invalidate)
+event.listen(Drink, 'expire', Drink.invalidate)
+event.listen(Drink, 'refresh', Drink.invalidate)
+
+
+'''
+MenuCache
+    keeps the serialized body of each menu view (the drinks' short() or
+    long() list) so GET /drinks and /drinks-detail don't query and
+    serialize the whole menu on every request. Bodies are tagged with the
+    menu version, which is bumped when a transaction that inserted, updated
+    or deleted a drink commits. That keeps this worker's copy exact. Writes
+    from other workers are picked up once a body is older than ttl seconds.
+'''
+
+
+class MenuCache:
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self.lock = Lock()
+        self.version = 0
+        self.bodies = {}
+
+    def get(self, view, render):
+        '''
+        returns (body, etag) for the view, calling render() to build the
+        body bytes when the cached one is missing, outdated or too old
+        '''
+        with self.lock:
+            version = self.version
+            cached = self.bodies.get(view)
+        if cached and cached[0] == version and time.monotonic() - cached[1] <= self.ttl:
+            return cached[2], cached[3]
+
+        body = render()
+        etag = hashlib.sha1(body).hexdigest()
+        with self.lock:
+            # A write committed while rendering may not be in the body
+            if self.version == version:
+                self.bodies[view] = (version, time.monotonic(), body, etag)
+        return body, etag
+
+    def bump(self, *args):
+        with self.lock:
+            self.version += 1
+            self.bodies.clear()
+
+
+menu_cache = MenuCache()
+
+
+def mark_menu_changed(mapper, connection, target):
+    object_session(target).info['menu_changed'] = True
+
+
+def bump_menu_version(session):
+    if session.info.pop('menu_changed', False):
+        menu_cache.bump()
+
+
+def forget_menu_changes(session):
+    session.info.pop('menu_changed', None)
+
+
+for drink_event in ('after_insert', 'after_update', 'after_delete'):
+    event.listen(Drink, drink_event, mark_menu_changed)
+event.listen(Session, 'after_commit', bump_menu_version)
+event.listen(Session, 'after_rollback', forget_menu_changes)
@@ -0,0 +1,173 @@
+#----------------------------------------------------------------------------#
+# Per-request SQL query profiler.
+#
+# QueryProfiler(app) times every statement SQLAlchemy sends to the database
+# while a request is handled, and when the response is ready:
+#
+#   - adds a Server-Timing header with the number of statements, the time
+#     spent in the database and in the whole request, so the browser's
+#     network panel shows them next to each request
+#   - logs one JSON line to the 'query_profiler' logger (at INFO), with the
+#     endpoint, the counts and timings and the slowest statements
+#
+# Statements run outside a request (CLI commands, startup) are not counted.
+#
+#   QUERY_PROFILER          profile requests (True)
+#   QUERY_PROFILER_SLOWEST  number of slowest statements logged (3)
+#
+# assert_max_queries(app, n) fails a test when a request made inside it runs
+# more than n statements, which is how N+1 queries show up.
+#
+# The three apps share no package, so each ships this file
+# (01_fyyur/starter_code/query_profiler.py, 02_trivia_api/starter/backend/
+# query_profiler.py, 03_coffee_shop_full_stack/starter_code/backend/src/
+# database/query_profiler.py). The copies must stay identical; Fyyur's
+# test_app.py fails when they drift.
+#----------------------------------------------------------------------------#
+
+import heapq
+import json
+import logging
+import time
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger('query_profiler')
+
+# Longest statement text kept in logs and assertion messages
+STATEMENT_LENGTH = 200
+
+
+class RequestProfile:
+    def __init__(self, method, path, slowest=3):
+        self.method = method
+        self.path = path
+        self.endpoint = None
+        self.status = None
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.seconds = None
+        self.started = time.perf_counter()
+        self.keep = slowest
+        # Min-heap of (seconds, order, statement), the fastest on top
+        self.slowest = []
+
+    def add(self, statement, seconds):
+        self.queries += 1
+        self.db_seconds += seconds
+        if not self.keep:
+            return
+        entry = (seconds, self.queries, statement)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def finish(self, endpoint, status):
+        self.endpoint = endpoint
+        self.status = status
+        self.seconds = time.perf_counter() - self.started
+
+    def slowest_statements(self):
+        return [{'ms': round(seconds * 1000, 3),
+                 'statement': ' '.join(statement.split())[:STATEMENT_LENGTH]}
+                for seconds, _, statement in sorted(self.slowest, reverse=True)]
+
+    def server_timing(self):
+        return 'db;desc="{} queries";dur={:.3f}, app;dur={:.3f}'.format(
+            self.queries, self.db_seconds * 1000, self.seconds * 1000)
+
+    def to_dict(self):
+        return {
+            'method': self.method,
+            'path': self.path,
+            'endpoint': self.endpoint,
+            'status': self.status,
+            'queries': self.queries,
+            'db_ms': round(self.db_seconds * 1000, 3),
+            'request_ms': round(self.seconds * 1000, 3),
+            'slowest': self.slowest_statements(),
+        }
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_app_context() and 'query_profile' in g:
+        context._profiler_started = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profiler_started', None)
+    if started is not None and has_app_context() and 'query_profile' in g:
+        g.query_profile.add(statement, time.perf_counter() - started)
+
+
+class QueryProfiler:
+    def __init__(self, app=None):
+        self.recorders = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('QUERY_PROFILER', True)
+        app.config.setdefault('QUERY_PROFILER_SLOWEST', 3)
+        app.extensions['query_profiler'] = self
+        # Every engine is instrumented, only statements run while a
+        # profiled request is handled are counted
+        if not event.contains(Engine, 'before_cursor_execute', before_cursor_execute):
+            event.listen(Engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', after_cursor_execute)
+        # Flask's request signals need blinker, which the app doesn't
+        # depend on, so the profile follows the request hooks instead
+        app.before_request(self.start)
+        app.after_request(self.finish)
+        app.teardown_request(self.discard)
+
+    def start(self):
+        if current_app.config['QUERY_PROFILER']:
+            g.query_profile = RequestProfile(
+                request.method, request.path,
+                current_app.config['QUERY_PROFILER_SLOWEST'])
+
+    def finish(self, response):
+        profile = g.pop('query_profile', None)
+        if profile is None:
+            return response
+        profile.finish(request.endpoint, response.status_code)
+        response.headers.add('Server-Timing', profile.server_timing())
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(profile.to_dict()))
+        for profiles in self.recorders:
+            profiles.append(profile)
+        return response
+
+    def discard(self, error=None):
+        # A request that failed before after_request keeps no profile
+        g.pop('query_profile', None)
+
+    @contextmanager
+    def record(self):
+        """Collects the profile of each request finished inside the block"""
+        profiles = []
+        self.recorders.append(profiles)
+        try:
+            yield profiles
+        finally:
+            self.recorders.remove(profiles)
+
+
+@contextmanager
+def assert_max_queries(app, limit):
+    """Fails when a request made inside the block runs more than limit
+    statements. Yields the list of request profiles."""
+    with app.extensions['query_profiler'].record() as profiles:
+        yield profiles
+    over = [profile for profile in profiles if profile.queries > limit]
+    if over:
+        raise AssertionError('\n'.join(
+            '{} {} ({}) ran {} queries, at most {} expected. Slowest: {}'.format(
+                profile.method, profile.path, profile.endpoint, profile.queries,
+                limit, json.dumps(profile.slowest_statements()))
+            for profile in over))
@@ -0,0 +1,91 @@
+import os
+
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+'''
+SQLite engine profiles
+    how the app connects to its SQLite database, picked with the
+    SQLITE_PROFILE environment variable ('tuned' by default)
+
+    plain   what Flask-SQLAlchemy does out of the box: a new connection per
+            session (NullPool), rollback journal, synchronous=FULL and
+            sqlite3's 5 second lock timeout
+    tuned   WAL journal, so readers don't block the writer and the other way
+            round, synchronous=NORMAL (durable at checkpoints, never
+            corrupt), a larger page cache and memory-mapped reads, and a
+            pool of connections kept open. Writers wait up to busy_timeout
+            seconds for the write lock instead of failing with "database is
+            locked".
+
+    Pool size and busy timeout can also be set with SQLITE_POOL_SIZE and
+    SQLITE_BUSY_TIMEOUT.
+'''
+
+
+class SQLiteProfile:
+    def __init__(self, name, pragmas=(), busy_timeout=5, pool_size=None,
+                 max_overflow=10):
+        self.name = name
+        self.pragmas = pragmas
+        self.busy_timeout = busy_timeout
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+
+    def engine_options(self):
+        '''
+        returns the options for SQLALCHEMY_ENGINE_OPTIONS
+        '''
+        if not self.pool_size:
+            return {}
+        return {
+            'poolclass': QueuePool,
+            'pool_size': self.pool_size,
+            'max_overflow': self.max_overflow,
+            'pool_timeout': self.busy_timeout,
+            'connect_args': {
+                'timeout': self.busy_timeout,
+                # Pooled connections are handed to any thread
+                'check_same_thread': False
+            }
+        }
+
+    def install(self, engine):
+        '''
+        sets the pragmas on every new connection of engine
+        '''
+        if self.pragmas and engine.dialect.name == 'sqlite':
+            event.listen(engine, 'connect', self.on_connect)
+
+    def on_connect(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma, value in self.pragmas:
+            cursor.execute('PRAGMA {} = {}'.format(pragma, value))
+        cursor.close()
+
+
+def tuned_profile():
+    busy_timeout = float(os.environ.get('SQLITE_BUSY_TIMEOUT', 5))
+    return SQLiteProfile(
+        'tuned',
+        pragmas=[
+            ('journal_mode', 'WAL'),
+            ('synchronous', 'NORMAL'),
+            # Negative sizes are in KiB: a 16 MiB page cache
+            ('cache_size', -16000),
+            ('mmap_size', 128 * 1024 * 1024),
+            ('temp_store', 'MEMORY'),
+            ('busy_timeout', int(busy_timeout * 1000)),
+        ],
+        busy_timeout=busy_timeout,
+        pool_size=int(os.environ.get('SQLITE_POOL_SIZE', 5)))
+
+
+PROFILES = {
+    'plain': lambda: SQLiteProfile('plain'),
+    'tuned': tuned_profile,
+}
+
+
+def sqlite_profile(name=None):
+    return PROFILES[name or os.environ.get('SQLITE_PROFILE', 'tuned')]()
@@ -0,0 +1,312 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+# The app creates its database on import, keep it away from database.db
+DATABASE_DIRECTORY = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = 'sqlite:///{}'.format(
+    os.path.join(DATABASE_DIRECTORY, 'test.db'))
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import Session
+
+from src.api import app, reset_db
+from src.auth import auth
+from src.auth.jwks import JWKSKeyStore
+from src.auth.testing import JWKSStandIn
+from src.database.query_profiler import assert_max_queries
+from src.database.models import (db, db_drop_and_create_all, db_init_records, db_startup,
+                                 Drink, MenuCache, SCHEMA_VERSION, STARTUP_BUDGET, menu_cache,
+                                 parse_recipe)
+from test_auth import make_token, public_jwk
+
+RECIPE = [
+    {'name': 'milk', 'color': 'grey', 'parts': 1},
+    {'name': 'matcha', 'color': 'green', 'parts': 3}
+]
+
+
+class DrinkTestCase(unittest.TestCase):
+    """This class represents the drink model test case"""
+
+    def setUp(self):
+        self.drink = Drink(id=1, title='Matcha Shake', recipe=json.dumps(RECIPE))
+
+    def test_projections(self):
+        self.assertEqual(self.drink.long(), {
+            'id': 1, 'title': 'Matcha Shake', 'recipe': RECIPE})
+        self.assertEqual(self.drink.short(), {
+            'id': 1, 'title': 'Matcha Shake',
+            'recipe': [{'color': 'grey', 'parts': 1}, {'color': 'green', 'parts': 3}]})
+
+    def test_recipe_is_parsed_once(self):
+        parse_recipe.cache_clear()
+
+        for _ in range(3):
+            self.drink.short()
+            self.drink.long()
+
+        self.assertEqual(parse_recipe.cache_info().misses, 1)
+        self.assertIs(self.drink.short(), self.drink.short())
+
+    def test_projections_follow_updates(self):
+        self.drink.short()
+        self.drink.long()
+
+        self.drink.title = 'Matcha Latte'
+        self.drink.recipe = json.dumps(RECIPE[:1])
+
+        self.assertEqual(self.drink.short()['title'], 'Matcha Latte')
+        self.assertEqual(self.drink.long()['recipe'], RECIPE[:1])
+
+    def test_serialization_does_not_print(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            self.drink.short()
+            repr(self.drink)
+
+        self.assertEqual(output.getvalue(), '')
+
+
+class MenuCacheTestCase(unittest.TestCase):
+    """This class represents the menu cache test case"""
+
+    def setUp(self):
+        self.cache = MenuCache(ttl=60)
+        self.renders = 0
+
+    def render(self):
+        self.renders += 1
+        return json.dumps({'success': True, 'render': self.renders}).encode()
+
+    def test_body_is_rendered_once_per_version(self):
+        body, etag = self.cache.get('short', self.render)
+        again, same_etag = self.cache.get('short', self.render)
+
+        self.assertEqual(self.renders, 1)
+        self.assertIs(again, body)
+        self.assertEqual(same_etag, etag)
+
+    def test_bump_invalidates_every_view(self):
+        _, short_etag = self.cache.get('short', self.render)
+        self.cache.get('long', self.render)
+
+        self.cache.bump()
+        _, new_etag = self.cache.get('short', self.render)
+        self.cache.get('long', self.render)
+
+        self.assertEqual(self.renders, 4)
+        self.assertNotEqual(new_etag, short_etag)
+
+    def test_old_bodies_are_rendered_again(self):
+        self.cache.ttl = -1
+        self.cache.get('short', self.render)
+
+        self.cache.get('short', self.render)
+
+        self.assertEqual(self.renders, 2)
+
+    def test_committed_drink_writes_bump_version(self):
+        engine = create_engine('sqlite://')
+        Drink.metadata.create_all(engine)
+        session = Session(bind=engine)
+        version = menu_cache.version
+
+        session.add(Drink(title='Matcha Shake', recipe=json.dumps(RECIPE)))
+        session.flush()
+        session.rollback()
+        rolled_back_version = menu_cache.version
+        session.add(Drink(title='Matcha Shake', recipe=json.dumps(RECIPE)))
+        session.commit()
+        session.close()
+
+        self.assertEqual(rolled_back_version, version)
+        self.assertEqual(menu_cache.version, version + 1)
+
+
+class CoffeeShopTestCase(unittest.TestCase):
+    """This class represents the coffee shop API test case"""
+
+    def setUp(self):
+        self.provider = JWKSStandIn({'keys': [public_jwk('test-key')]}).start()
+        self.original_store = auth.jwks_store
+        auth.jwks_store = JWKSKeyStore(self.provider.url)
+        self.client = app.test_client
+        self.headers = {'Authorization': 'Bearer ' + make_token(
+            permissions=['get:drinks-detail', 'post:drinks', 'patch:drinks', 'delete:drinks'])}
+        with app.app_context():
+            db_drop_and_create_all()
+
+    def tearDown(self):
+        auth.jwks_store = self.original_store
+        self.provider.stop()
+        db.session.remove()
+
+    def titles(self):
+        return [drink['title'] for drink in self.client().get('/drinks').get_json()['drinks']]
+
+    def schema_version(self):
+        return db.session.execute('PRAGMA user_version').scalar()
+
+    #Test startup
+    def test_startup_keeps_records(self):
+        self.client().post('/drinks', headers=self.headers, json={
+            'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]})
+
+        with app.app_context():
+            db_startup()
+
+        self.assertEqual(self.titles(), ['Matcha Shake', 'Purple Pain', 'Water'])
+
+    def test_startup_leaves_up_to_date_database_alone(self):
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                db_startup()
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+
+        # Only the schema version is read: no DDL and no reseeding
+        self.assertEqual(statements, ['PRAGMA user_version'])
+        self.assertEqual(self.titles(), ['Matcha Shake', 'Purple Pain'])
+
+    def test_startup_is_fast_on_up_to_date_database(self):
+        # Ten times the budget, so only a regression fails on a slow machine.
+        # python benchmarks.py startup checks the budget itself
+        with app.app_context():
+            seconds = max(db_startup() for _ in range(5))
+
+        self.assertLess(seconds, STARTUP_BUDGET * 10)
+
+    def test_startup_creates_and_seeds_new_database(self):
+        with app.app_context():
+            db.drop_all()
+            db.session.execute('PRAGMA user_version = 0')
+            db.session.commit()
+
+            db_startup()
+            version = self.schema_version()
+
+        self.assertEqual(version, SCHEMA_VERSION)
+        self.assertEqual(self.titles(), ['Matcha Shake', 'Purple Pain'])
+
+    def test_startup_adopts_unversioned_database(self):
+        with app.app_context():
+            db.session.execute('PRAGMA user_version = 0')
+            Drink.query.get(1).delete()
+
+            db_startup()
+            version = self.schema_version()
+
+        self.assertEqual(version, SCHEMA_VERSION)
+        self.assertEqual(self.titles(), ['Purple Pain'])
+
+    def test_seeding_is_idempotent(self):
+        with app.app_context():
+            db_init_records()
+            db_init_records()
+
+        self.assertEqual(self.titles(), ['Matcha Shake', 'Purple Pain'])
+
+    def test_reset_db_command(self):
+        with app.app_context():
+            Drink.query.get(1).delete()
+
+        result = app.test_cli_runner().invoke(reset_db)
+
+        self.assertEqual(result.exit_code, 0)
+        self.assertEqual(self.titles(), ['Matcha Shake', 'Purple Pain'])
+
+    def test_database_uses_tuned_profile(self):
+        pragmas = {name: db.session.execute('PRAGMA {}'.format(name)).scalar()
+                   for name in ('journal_mode', 'synchronous', 'busy_timeout')}
+
+        self.assertEqual(pragmas, {'journal_mode': 'wal', 'synchronous': 1, 'busy_timeout': 5000})
+
+    #Test menu
+    def test_menu_etag(self):
+        res = self.client().get('/drinks')
+        cached = self.client().get('/drinks', headers={'If-None-Match': res.headers['ETag']})
+        self.client().post('/drinks', headers=self.headers, json={
+            'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]})
+        changed = self.client().get('/drinks', headers={'If-None-Match': res.headers['ETag']})
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(changed.status_code, 200)
+        self.assertEqual(len(changed.get_json()['drinks']), 3)
+
+    def test_menu_stays_within_query_budget(self):
+        menu_cache.bump()
+
+        with assert_max_queries(app, 1) as profiles:
+            first = self.client().get('/drinks')
+            cached = self.client().get('/drinks')
+            self.client().get('/drinks-detail', headers=self.headers)
+
+        self.assertEqual([profile.queries for profile in profiles], [1, 0, 1])
+        self.assertIn('db;desc="1 queries"', first.headers['Server-Timing'])
+        self.assertIn('db;desc="0 queries"', cached.headers['Server-Timing'])
+
+    def test_get_drinks_detail(self):
+        res = self.client().get('/drinks-detail', headers=self.headers)
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['drinks'][0]['recipe'][0]['name'], 'milk')
+
+    #Test create drinks
+    def test_create_drink(self):
+        res = self.client().post('/drinks', headers=self.headers, json={
+            'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]})
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(data['drinks'][0]['title'], 'Water')
+        self.assertEqual(data['drinks'][0]['id'], 3)
+
+    def test_400_create_drink_with_taken_title(self):
+        res = self.client().post('/drinks', headers=self.headers, json={
+            'title': 'Matcha Shake', 'recipe': [{'name': 'milk', 'color': 'grey', 'parts': 1}]})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_400_create_drink_without_recipe(self):
+        res = self.client().post('/drinks', headers=self.headers, json={'title': 'Water'})
+
+        self.assertEqual(res.status_code, 400)
+
+    def test_create_drinks_in_bulk(self):
+        res = self.client().post('/drinks', headers=self.headers, json=[
+            {'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]},
+            {'title': 'Tea', 'recipe': [{'name': 'tea', 'color': 'brown', 'parts': 1}]}])
+        data = res.get_json()
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([drink['title'] for drink in data['drinks']], ['Water', 'Tea'])
+
+    def test_bulk_create_is_all_or_nothing(self):
+        res = self.client().post('/drinks', headers=self.headers, json=[
+            {'title': 'Water', 'recipe': [{'name': 'water', 'color': 'blue', 'parts': 1}]},
+            {'title': 'Purple Pain', 'recipe': [{'name': 'guave', 'color': 'purple', 'parts': 1}]}])
+
+        self.assertEqual(res.status_code, 400)
+        self.assertEqual(self.titles(), ['Matcha Shake', 'Purple Pain'])
+
+
+def tearDownModule():
+    shutil.rmtree(DATABASE_DIRECTORY, ignore_errors=True)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
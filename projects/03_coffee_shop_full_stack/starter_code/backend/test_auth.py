@@ -0,0 +1,323 @@
+import os
+import tempfile
+import time
+import unittest
+
+from flask import Flask, jsonify
+from jose import jwk, jwt
+
+from src.auth import auth
+from src.auth.auth import AuthError, check_permissions, requires_auth, verify_decode_jwt
+from src.auth.jwks import JWKSKeyStore, cache_max_age
+from src.auth.permissions import TokenPayload, all_of, any_of
+from src.auth.testing import JWKSStandIn, jwks_file_url
+from src.auth.token_cache import VerifiedTokenCache
+
+# Throwaway key pair, only ever used to sign test tokens
+PRIVATE_KEY = open(os.path.join(os.path.dirname(__file__), 'test_jwt_key.pem')).read()
+
+
+def public_jwk(kid):
+    key = jwk.construct(PRIVATE_KEY, 'RS256').public_key().to_dict()
+    key.update({'kid': kid, 'use': 'sig'})
+    return key
+
+
+def make_token(kid='test-key', permissions=(), expires_in=3600):
+    claims = {
+        'iss': 'https://' + auth.AUTH0_DOMAIN + '/',
+        'aud': auth.API_AUDIENCE,
+        'sub': 'auth0|tester',
+        'exp': int(time.time()) + expires_in,
+        'permissions': list(permissions)
+    }
+    return jwt.encode(claims, PRIVATE_KEY, algorithm='RS256', headers={'kid': kid})
+
+
+class JWKSKeyStoreTestCase(unittest.TestCase):
+    """This class represents the JWKS key store test case"""
+
+    def setUp(self):
+        self.provider = JWKSStandIn({'keys': [public_jwk('test-key')]}).start()
+        self.original_store = auth.jwks_store
+
+    def tearDown(self):
+        auth.jwks_store = self.original_store
+        self.provider.stop()
+
+    def use_store(self, **options):
+        auth.jwks_store = JWKSKeyStore(self.provider.url, **options)
+        return auth.jwks_store
+
+    def wait_for_refresh(self, store):
+        deadline = time.monotonic() + 5
+        while store.refreshing and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def test_keys_are_fetched_once(self):
+        self.use_store()
+
+        for _ in range(5):
+            payload = verify_decode_jwt(make_token())
+
+        self.assertEqual(payload['sub'], 'auth0|tester')
+        self.assertEqual(self.provider.requests, 1)
+
+    def test_ttl_follows_cache_control(self):
+        self.provider.cache_control = 'public, max-age=120'
+        store = self.use_store(min_ttl=30)
+
+        store.get_key('test-key')
+
+        self.assertTrue(90 < store.stats()['expires_in'] <= 120)
+        self.assertEqual(cache_max_age('no-store'), 0)
+        self.assertIsNone(cache_max_age(None))
+
+    def test_unknown_kid_refetches_at_most_once_per_interval(self):
+        store = self.use_store(unknown_kid_interval=0)
+        store.get_key('test-key')
+        self.provider.jwks = {'keys': [public_jwk('test-key'), public_jwk('rotated-key')]}
+
+        payload = verify_decode_jwt(make_token(kid='rotated-key'))
+        store.unknown_kid_interval = 60
+        for _ in range(3):
+            with self.assertRaises(AuthError):
+                verify_decode_jwt(make_token(kid='made-up-key'))
+
+        self.assertEqual(payload['sub'], 'auth0|tester')
+        self.assertEqual(self.provider.requests, 2)
+
+    def test_expired_keys_refresh_in_background(self):
+        self.provider.cache_control = 'max-age=0'
+        store = self.use_store(min_ttl=0)
+        verify_decode_jwt(make_token())
+
+        verify_decode_jwt(make_token())
+        self.wait_for_refresh(store)
+
+        self.assertEqual(self.provider.requests, 2)
+        self.assertEqual(store.stats()['fetches'], 2)
+
+    def test_stale_keys_are_served_when_fetch_fails(self):
+        self.provider.cache_control = 'max-age=0'
+        store = self.use_store(min_ttl=0)
+        verify_decode_jwt(make_token())
+        self.provider.failing = True
+
+        payload = verify_decode_jwt(make_token())
+        self.wait_for_refresh(store)
+        payload = verify_decode_jwt(make_token())
+
+        self.assertEqual(payload['sub'], 'auth0|tester')
+        self.assertTrue(store.stats()['failures'] >= 1)
+
+    def test_no_keys_available(self):
+        self.provider.failing = True
+        self.use_store()
+
+        with self.assertRaises(AuthError) as context:
+            verify_decode_jwt(make_token())
+
+        self.assertEqual(context.exception.status_code, 503)
+
+    def test_keys_from_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            url = jwks_file_url(os.path.join(directory, 'jwks.json'),
+                                {'keys': [public_jwk('test-key')]})
+            auth.jwks_store = JWKSKeyStore(url)
+
+            payload = verify_decode_jwt(make_token())
+
+        self.assertEqual(payload['sub'], 'auth0|tester')
+
+
+class VerifiedTokenCacheTestCase(unittest.TestCase):
+    """This class represents the verified token cache test case"""
+
+    def setUp(self):
+        self.now = 1000
+        self.cache = VerifiedTokenCache(max_entries=2, clock=lambda: self.now)
+        self.verified = []
+
+    def verify(self, token):
+        self.verified.append(token)
+        return {'sub': token, 'exp': 1060}
+
+    def test_token_is_verified_once(self):
+        for _ in range(3):
+            payload = self.cache.verify('token', self.verify)
+        stats = self.cache.stats()
+
+        self.assertEqual(payload['sub'], 'token')
+        self.assertEqual(self.verified, ['token'])
+        self.assertEqual(stats['hits'], 2)
+        self.assertAlmostEqual(stats['hit_rate'], 2 / 3)
+        self.assertTrue(stats['saved_seconds'] > 0)
+
+    def test_token_is_verified_again_once_expired(self):
+        self.cache.verify('token', self.verify)
+        self.now = 1060
+
+        self.cache.verify('token', self.verify)
+
+        self.assertEqual(self.verified, ['token', 'token'])
+
+    def test_bypass_always_verifies(self):
+        self.cache.verify('token', self.verify)
+
+        self.cache.verify('token', self.verify, bypass=True)
+
+        self.assertEqual(len(self.verified), 2)
+        self.assertEqual(self.cache.stats()['bypasses'], 1)
+
+    def test_least_recently_used_token_is_evicted(self):
+        for token in ('first', 'second', 'first', 'third'):
+            self.cache.verify(token, self.verify)
+
+        self.cache.verify('first', self.verify)
+        self.cache.verify('second', self.verify)
+
+        self.assertEqual(self.verified, ['first', 'second', 'third', 'second'])
+
+    def test_failed_verification_is_not_cached(self):
+        def reject(token):
+            raise AuthError({'code': 'invalid_header'}, 401)
+
+        for _ in range(2):
+            with self.assertRaises(AuthError):
+                self.cache.verify('token', reject)
+
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_tokens_without_exp_are_not_cached(self):
+        self.cache.verify('token', lambda token: {'sub': token})
+
+        self.assertEqual(self.cache.stats()['entries'], 0)
+
+    def test_basic_flask_auth_copy_matches(self):
+        backend = os.path.dirname(os.path.abspath(__file__))
+        with open(os.path.join(backend, 'src', 'auth', 'token_cache.py')) as module:
+            expected = module.read()
+        with open(os.path.join(backend, os.pardir, os.pardir, os.pardir, os.pardir,
+                               'BasicFlaskAuth', 'token_cache.py')) as module:
+            self.assertEqual(module.read(), expected)
+
+
+class RequiresAuthTestCase(unittest.TestCase):
+    """This class represents the requires_auth decorator test case"""
+
+    def setUp(self):
+        self.provider = JWKSStandIn({'keys': [public_jwk('test-key')]}).start()
+        self.original_store = auth.jwks_store
+        self.original_cache = auth.token_cache
+        auth.jwks_store = JWKSKeyStore(self.provider.url)
+        auth.token_cache = VerifiedTokenCache()
+
+        app = Flask(__name__)
+
+        @app.route('/drinks-detail')
+        @requires_auth('get:drinks-detail')
+        def drinks_detail(payload):
+            return jsonify({'success': True})
+
+        @app.route('/drinks/1', methods=['DELETE'])
+        @requires_auth('delete:drinks', bypass_cache=True)
+        def delete_drink(payload):
+            return jsonify({'success': True})
+
+        @app.route('/drinks', methods=['POST', 'PATCH'])
+        @requires_auth(any_of('post:drinks', 'patch:drinks'))
+        def write_drinks(payload):
+            return jsonify({'success': True})
+
+        @app.errorhandler(AuthError)
+        def auth_error(error):
+            return jsonify({'success': False}), error.status_code
+
+        self.client = app.test_client
+
+    def tearDown(self):
+        auth.jwks_store = self.original_store
+        auth.token_cache = self.original_cache
+        self.provider.stop()
+
+    def get(self, path, token, method='get'):
+        return getattr(self.client(), method)(
+            path, headers={'Authorization': 'Bearer ' + token})
+
+    def test_repeated_token_is_verified_once(self):
+        token = make_token(permissions=['get:drinks-detail'])
+
+        responses = [self.get('/drinks-detail', token) for _ in range(3)]
+
+        self.assertEqual([res.status_code for res in responses], [200, 200, 200])
+        self.assertEqual(auth.token_cache.stats()['hits'], 2)
+
+    def test_cached_token_still_needs_the_permission(self):
+        token = make_token(permissions=['get:drinks-detail'])
+        self.get('/drinks-detail', token)
+
+        res = self.get('/drinks/1', token, method='delete')
+
+        self.assertEqual(res.status_code, 401)
+
+    def test_sensitive_permission_bypasses_cache(self):
+        token = make_token(permissions=['delete:drinks'])
+
+        for _ in range(2):
+            res = self.get('/drinks/1', token, method='delete')
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(auth.token_cache.stats()['hits'], 0)
+        self.assertEqual(auth.token_cache.stats()['bypasses'], 2)
+
+    def test_payload_carries_permission_set(self):
+        payload = verify_decode_jwt(make_token(permissions=['get:drinks-detail']))
+
+        self.assertIsInstance(payload, TokenPayload)
+        self.assertIn('get:drinks-detail', payload.permission_set)
+
+    def test_any_of_requirement(self):
+        allowed = self.get('/drinks', make_token(permissions=['patch:drinks']), method='post')
+        denied = self.get('/drinks', make_token(permissions=['get:drinks']), method='post')
+
+        self.assertEqual(allowed.status_code, 200)
+        self.assertEqual(denied.status_code, 401)
+
+
+class PermissionsTestCase(unittest.TestCase):
+    """This class represents the permission requirements test case"""
+
+    def setUp(self):
+        self.payload = TokenPayload({'permissions': ['get:drinks-detail', 'post:drinks']})
+
+    def assertAllowed(self, permission, payload=None):
+        self.assertTrue(check_permissions(permission, payload or self.payload))
+
+    def assertDenied(self, permission, payload=None):
+        with self.assertRaises(AuthError) as context:
+            check_permissions(permission, payload or self.payload)
+        self.assertEqual(context.exception.status_code, 401)
+
+    def test_single_permission(self):
+        self.assertAllowed('post:drinks')
+        self.assertDenied('delete:drinks')
+
+    def test_scope_wildcards(self):
+        self.assertAllowed('get:*')
+        self.assertAllowed('*:drinks')
+        self.assertDenied('patch:*')
+
+    def test_compound_requirements(self):
+        self.assertAllowed(any_of('delete:drinks', 'post:drinks'))
+        self.assertDenied(all_of('delete:drinks', 'post:drinks'))
+        self.assertAllowed(all_of('get:drinks-detail', any_of('delete:drinks', '*:drinks')))
+
+    def test_plain_payload(self):
+        self.assertAllowed('post:drinks', {'permissions': ['post:drinks']})
+        self.assertDenied('post:drinks', {'sub': 'auth0|tester'})
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()